@@ -0,0 +1,252 @@
+import math
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+from utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Large fact tables worth sampling; dimension tables joined to them are read in full.
+APPROX_TABLES = {t.strip().lower() for t in os.environ.get("APPROX_TABLES", "deliveries").split(",") if t.strip()}
+# Total sample size across all replicates, in percent of the sampled table.
+APPROX_SAMPLE_PERCENT = float(os.environ.get("APPROX_SAMPLE_PERCENT", 2))
+# Independent samples; the spread between them gives the error bounds.
+APPROX_REPLICATES = int(os.environ.get("APPROX_REPLICATES", 4))
+# SYSTEM samples whole pages (fast, reads only the sample); BERNOULLI samples rows (scans the table).
+APPROX_SAMPLE_METHOD = os.environ.get("APPROX_SAMPLE_METHOD", "SYSTEM").upper()
+APPROX_SEED = int(os.environ.get("APPROX_SEED", 42))
+
+# Two-sided 95% Student t quantiles by number of replicates.
+T_QUANTILES = {2: 12.706, 3: 4.303, 4: 3.182, 5: 2.776, 6: 2.571, 7: 2.447, 8: 2.365, 9: 2.306, 10: 2.262}
+
+_exact_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("APPROX_BACKGROUND_WORKERS", 4)), thread_name_prefix="exact-query"
+)
+
+
+def rewrite_for_sample(
+    sql_query: str,
+    sample_percent: float,
+    seed: int,
+    dialect: str = "postgres",
+    tables: set[str] = APPROX_TABLES,
+    method: str = APPROX_SAMPLE_METHOD,
+) -> tuple[str, dict[int, str]]:
+    """
+    Rewrite an aggregate query to read a TABLESAMPLE of its fact table, scaling
+    COUNT and SUM so they estimate the full-table value (AVG needs no scaling).
+    Returns the SQL and {position: "total" | "mean"} for the estimated output
+    columns: a bare COUNT/SUM is a total, anything else (AVG, ratios) a mean.
+    Raises ValueError for queries whose answer cannot be estimated from a sample,
+    including LIMIT/OFFSET and HAVING: a group they remove from one replicate would
+    be read as a group the sample missed. `split_ordering` lifts ORDER BY/LIMIT/OFFSET
+    out so they can be applied to the merged estimate instead.
+    """
+    tree = sqlglot.parse_one(sql_query, read=dialect)
+    if not isinstance(tree, exp.Select):
+        raise ValueError("Only single SELECT statements can be approximated")
+    if tree.args.get("limit") or tree.args.get("offset"):
+        raise ValueError("LIMIT/OFFSET must be applied to the merged estimate, not to each sample")
+    if tree.args.get("having"):
+        raise ValueError("HAVING filters groups by their sampled value and cannot be approximated")
+    if tree.find(exp.Subquery, exp.CTE, exp.Union, exp.Window):
+        raise ValueError("Subqueries, CTEs, set operations and window functions are not approximated")
+    if any(isinstance(expression, exp.Star) for expression in tree.expressions):
+        raise ValueError("SELECT * cannot be approximated")
+
+    sampled = [table for table in tree.find_all(exp.Table) if table.name.lower() in tables]
+    if len(sampled) != 1:
+        raise ValueError(f"Query must read exactly one sampled table ({', '.join(sorted(tables))})")
+    aggregates = list(tree.find_all(exp.AggFunc))
+    if not aggregates:
+        raise ValueError("Only aggregate queries can be approximated")
+    for agg in aggregates:
+        if not isinstance(agg, (exp.Count, exp.Sum, exp.Avg)) or agg.find(exp.Distinct):
+            raise ValueError(f"{agg.sql(dialect)} cannot be estimated from a sample")
+
+    positions = {
+        i: "total" if isinstance(expression.unalias(), (exp.Count, exp.Sum)) else "mean"
+        for i, expression in enumerate(tree.expressions)
+        if expression.find(exp.AggFunc)
+    }
+
+    scale = exp.Literal.number(100 / sample_percent)
+    for agg in aggregates:
+        if isinstance(agg, exp.Avg):
+            continue
+        scaled = exp.Paren(this=exp.Mul(this=agg.copy(), expression=scale.copy()))
+        if agg.parent is tree:
+            # Keep the column name the unsampled query would have had.
+            scaled = exp.alias_(scaled, agg.key)
+        agg.replace(scaled)
+
+    # sqlglot does not render TABLESAMPLE the same way for every dialect, so the
+    # table is swapped for a placeholder and the sampled subquery spliced in.
+    table = sampled[0]
+    placeholder = "__approx_sample__"
+    source = table.copy()
+    source.set("alias", None)
+    table.replace(exp.Table(this=exp.to_identifier(placeholder), alias=exp.TableAlias(this=exp.to_identifier(table.alias_or_name))))
+    percent = f"{sample_percent:g} PERCENT" if dialect == "duckdb" else f"{sample_percent:g}"
+    sample = f"(SELECT * FROM {source.sql(dialect)} TABLESAMPLE {method} ({percent}) REPEATABLE ({seed}))"
+    return tree.sql(dialect).replace(placeholder, sample, 1), positions
+
+
+def split_ordering(sql_query: str, dialect: str = "postgres") -> tuple[str, dict]:
+    """
+    Remove ORDER BY, LIMIT and OFFSET from a SELECT so each sample returns every group.
+    Returns the SQL and {"order": [(position, descending)], "limit", "offset"} for
+    `apply_ordering`. Raises ValueError when an ORDER BY key is not an output column.
+    """
+    tree = sqlglot.parse_one(sql_query, read=dialect)
+    ordering = {"order": [], "limit": None, "offset": 0}
+    if not isinstance(tree, exp.Select):
+        return sql_query, ordering
+
+    outputs = [expression.alias_or_name for expression in tree.expressions]
+    unaliased = [expression.unalias() for expression in tree.expressions]
+    order = tree.args.get("order")
+    for ordered in order.expressions if order else []:
+        key = ordered.this
+        if isinstance(key, exp.Literal) and key.is_int:
+            position = int(key.name) - 1
+        elif isinstance(key, exp.Column) and not key.table and key.name in outputs:
+            position = outputs.index(key.name)
+        elif key in unaliased:
+            position = unaliased.index(key)
+        else:
+            raise ValueError(f"ORDER BY {key.sql(dialect)} is not an output column and cannot order an estimate")
+        ordering["order"].append((position, bool(ordered.args.get("desc"))))
+    for arg in ("limit", "offset"):
+        node = tree.args.get(arg)
+        if node is None:
+            continue
+        value = node.expression
+        if not (isinstance(value, exp.Literal) and value.is_int):
+            raise ValueError(f"{arg.upper()} {value.sql(dialect)} cannot be applied to an estimate")
+        ordering[arg] = int(value.name)
+        tree.set(arg, None)
+    tree.set("order", None)
+    return tree.sql(dialect), ordering
+
+
+def apply_ordering(estimate: pd.DataFrame, ordering: dict) -> pd.DataFrame:
+    """Sort and slice a merged estimate the way the original query would have."""
+    if ordering["order"]:
+        estimate = estimate.sort_values(
+            by=[estimate.columns[position] for position, _ in ordering["order"]],
+            ascending=[not descending for _, descending in ordering["order"]],
+            kind="stable",
+        )
+    stop = None if ordering["limit"] is None else ordering["offset"] + ordering["limit"]
+    return estimate.iloc[ordering["offset"] : stop].reset_index(drop=True)
+
+
+def merge_replicates(frames: list[pd.DataFrame], positions: dict[int, str]) -> pd.DataFrame | None:
+    """
+    Average replicate results per group and add a `<column>_error` 95% half-width
+    for each estimated column; None when the samples contained no rows at all.
+
+    Every replicate is aligned to the union of groups. A group missing from a
+    replicate (or a NULL SUM) means that sample drew none of its rows, so totals
+    count it as 0; means are averaged over the replicates that saw the group.
+    """
+    columns = list(frames[0].columns)
+    estimates = {columns[i]: kind for i, kind in positions.items()}
+    keys = [column for column in columns if column not in estimates]
+    if not keys:
+        frames = [frame.assign(_all=0) for frame in frames]
+        keys = ["_all"]
+
+    groups = pd.concat(frames, ignore_index=True)[keys].drop_duplicates()
+    if groups.empty:
+        return None
+    aligned = [groups.merge(frame, on=keys, how="left") for frame in frames]
+
+    result = groups.reset_index(drop=True)
+    bounds = {}
+    for column, kind in estimates.items():
+        values = pd.concat([frame[column].astype(float) for frame in aligned], axis=1)
+        if kind == "total":
+            values = values.fillna(0.0)
+        n = values.count(axis=1)
+        t = n.map(lambda k: T_QUANTILES.get(k, 1.96))
+        result[column] = values.mean(axis=1)
+        bounds[f"{column}_error"] = t * values.std(axis=1) / n.pow(0.5)
+
+    totals = [column for column, kind in estimates.items() if kind == "total"]
+    if totals and (result[totals] == 0).all().all():
+        return None
+    if result[list(estimates)].isna().all().all():
+        return None
+
+    result = result[columns].copy()  # original column order, without "_all"
+    for column, bound in bounds.items():
+        result[column] = bound.to_numpy()
+    return result
+
+
+def can_approximate(sql_query: str, dialect: str = "postgres") -> bool:
+    """Whether `run_progressive` could produce an estimate, checked without running anything."""
+    try:
+        rewrite_for_sample(split_ordering(sql_query, dialect)[0], APPROX_SAMPLE_PERCENT, APPROX_SEED, dialect)
+    except (ValueError, sqlglot.errors.ParseError):
+        return False
+    return True
+
+
+def run_progressive(
+    execute,
+    sql_query: str,
+    dialect: str = "postgres",
+    sample_percent: float = APPROX_SAMPLE_PERCENT,
+    replicates: int = APPROX_REPLICATES,
+) -> dict:
+    """
+    Start the exact query in the background and answer first from samples.
+
+    `execute(sql)` must return `(df, error)` like `LLMQueryHandler.execute_sql_on_db`.
+    Returns {"ESTIMATE": DataFrame or None, "SAMPLE_PERCENT", "REASON": why there
+    is no estimate, "EXACT": Future resolving to the exact `(df, error)`}.
+    """
+    exact: Future = _exact_executor.submit(execute, sql_query)
+    result = {"ESTIMATE": None, "SAMPLE_PERCENT": sample_percent, "REASON": None, "EXACT": exact}
+
+    try:
+        unordered_sql, ordering = split_ordering(sql_query, dialect)
+        plans = [
+            rewrite_for_sample(unordered_sql, sample_percent / replicates, APPROX_SEED + r, dialect)
+            for r in range(replicates)
+        ]
+    except (ValueError, sqlglot.errors.ParseError) as e:
+        result["REASON"] = str(e)
+        logger.info(f"No approximate answer: {e}")
+        return result
+
+    with ThreadPoolExecutor(max_workers=replicates) as pool:
+        outputs = list(pool.map(execute, [sql for sql, _ in plans]))
+    errors = [error for _, error in outputs if error is not None]
+    if errors:
+        result["REASON"] = errors[0]
+        logger.warning(f"Sampled query failed, waiting for exact answer: {errors[0]}")
+        return result
+
+    estimate = merge_replicates([df for df, _ in outputs], plans[0][1])
+    if estimate is None:
+        result["REASON"] = "The samples contained no matching rows"
+        logger.info(f"No approximate answer: {result['REASON']}")
+        return result
+    result["ESTIMATE"] = apply_ordering(estimate, ordering)
+    logger.info(f"Approximate answer from a {sample_percent:g}% sample in {replicates} replicates: {plans[0][0]}")
+    return result
+
+
+def relative_error(estimate: pd.DataFrame) -> float:
+    """Largest error bound relative to its estimate, for a one-line summary."""
+    ratios = []
+    for column in [c for c in estimate.columns if c.endswith("_error")]:
+        values = estimate[column[: -len("_error")]].abs()
+        ratios.extend((estimate[column] / values).replace([float("inf")], float("nan")).dropna())
+    return max(ratios) if ratios else math.nan
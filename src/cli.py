@@ -1,11 +1,16 @@
 import argparse
-import psycopg2
-import pandas as pd
-from dotenv import load_dotenv
+import importlib
 import os
+import re
+import sys
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from utils import get_text_hash, sanitize_filename, setup_logger
-from query_llm import LLMQueryHandler
+from dotenv import load_dotenv
+from utils import get_text_hash, sanitize_filename, setup_logger, log_generated_query
+
+# Heavy dependencies (pandas, psycopg2, llama_index, LLM SDKs) are imported
+# inside the functions that need them so a run only pays for what it uses.
 
 # Load .env variables
 load_dotenv()
@@ -19,45 +24,149 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_PORT = os.getenv("DB_PORT", 5432)
 OUTPUT_DATA_PATH = os.getenv("OUTPUT_DATA_PATH")
 CONTEXT_FILE = os.getenv("CONTEXT_FILE", "data/context.txt")
+EXAMPLE_STORE_DIR = os.getenv("EXAMPLE_STORE_DIR")
+PARQUET_DIR = os.getenv("PARQUET_DIR", "data/parquet")
+# Warn when deferred imports take longer than this in total.
+IMPORT_BUDGET_MS = float(os.getenv("CLI_IMPORT_BUDGET_MS", 1500))
+
+import_timings = {}
+
+# Modules the handler imports lazily on first use. They are loaded up front
+# (the run needs them anyway) so their cost shows up in the import report.
+VECTOR_STORE_MODULES = {
+    "pinecone": ["llama_index.core", "llama_index.vector_stores.pinecone", "llama_index.embeddings.openai", "pinecone"],
+}
+PROVIDER_MODULES = {"gpt": ["openai"], "claude": ["anthropic"]}
+
+
+@contextmanager
+def timed_import(label: str):
+    """Record wall-clock time spent importing a group of modules."""
+    start = time.perf_counter()
+    yield
+    import_timings[label] = import_timings.get(label, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def report_import_timings():
+    """Log per-group import times against the budget; run with `python -X importtime` for a per-module tree."""
+    total = sum(import_timings.values())
+    for label, ms in sorted(import_timings.items(), key=lambda item: -item[1]):
+        logger.info(f"import {label}: {ms:.1f} ms")
+    log = logger.warning if total > IMPORT_BUDGET_MS else logger.info
+    log(f"Deferred imports took {total:.1f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)")
+    return total
 
-if not all([DB_HOST, DB_NAME, DB_USER, DB_PASSWORD, OUTPUT_DATA_PATH]):
-    logger.error("Environment variables for DB or OUTPUT_DATA_PATH are missing")
-    raise ValueError("Missing environment variables for DB or OUTPUT_DATA_PATH")
 
-parser = argparse.ArgumentParser(
-    description="Generate & execute a SQL query from user prompt using RAG + LLM."
-)
-parser.add_argument("--user_prompt", required=True, help="User natural language query")
-parser.add_argument("--vector_store", required=True, help="pinecone or weaviate")
-parser.add_argument("--gpt_model", required=True, help="LLM model for SQL generation")
+def preload_imports(vector_store: str, models: list[str]):
+    """Import the vector store stack and LLM SDKs this run will use, timing each group."""
+    groups = {vector_store: VECTOR_STORE_MODULES.get(vector_store, [])}
+    for model in models:
+        match = re.search(r"(gpt|claude)", model)
+        if match:
+            groups[match.group()] = PROVIDER_MODULES[match.group()]
+    for label, modules in groups.items():
+        with timed_import(label):
+            for module in modules:
+                importlib.import_module(module)
 
-args = parser.parse_args()
 
-user_prompt = args.user_prompt
-vector_store = args.vector_store
-gpt_model = args.gpt_model
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate & execute a SQL query from user prompt using RAG + LLM."
+    )
+    parser.add_argument("--user_prompt", required=True, help="User natural language query")
+    parser.add_argument("--vector_store", required=True, help="pinecone or weaviate")
+    parser.add_argument("--gpt_model", required=True, help="LLM model for SQL generation")
+    parser.add_argument(
+        "--race_models",
+        default="",
+        help="Comma-separated models to query concurrently; the first valid SQL wins",
+    )
+    parser.add_argument(
+        "--fallback_models",
+        default="",
+        help="Comma-separated models tried in order if no raced model succeeds",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["postgres", "duckdb"],
+        default="postgres",
+        help="Run queries on PostgreSQL or on embedded DuckDB over PARQUET_DIR",
+    )
+    parser.add_argument(
+        "--approximate",
+        action="store_true",
+        help="Print an early estimate from a table sample before the exact result",
+    )
+    parser.add_argument(
+        "--profile_imports",
+        action="store_true",
+        help="Print deferred import timings to stderr",
+    )
+    return parser.parse_args(argv)
 
-logger.info(f"User Prompt: {user_prompt}")
-logger.info(f"Vector Store: {vector_store}")
-logger.info(f"GPT Model: {gpt_model}")
 
+def get_db_params(backend: str) -> dict:
+    if backend == "duckdb":
+        return {"parquet_dir": PARQUET_DIR}
+    return {
+        "host": DB_HOST,
+        "dbname": DB_NAME,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+        "port": DB_PORT,
+    }
 
-def generate_sql_query(user_prompt: str, vector_store: str, gpt_model: str, embed_model: str) -> str | None:
+
+def generate_sql_query(
+    user_prompt: str,
+    vector_store: str,
+    gpt_model: str,
+    embed_model: str,
+    race_models: list[str] = None,
+    fallback_models: list[str] = None,
+    backend: str = "postgres",
+) -> str | None:
     """Generate SQL query based on user prompt using LLM + semantic schema."""
     try:
+        with timed_import("query_llm"):
+            from query_llm import LLMQueryHandler
+        preload_imports(vector_store, [gpt_model] + (race_models or []) + (fallback_models or []))
+
+        example_store = None
+        if EXAMPLE_STORE_DIR:
+            with timed_import("example_store"):
+                from example_store import ExampleStore
+            example_store = ExampleStore(EXAMPLE_STORE_DIR)
+
         with open(CONTEXT_FILE, "r") as f:
             context_prompt = f.read()
-        handler = LLMQueryHandler(gpt_model, vector_store, embed_model, top_k=3)
+        handler = LLMQueryHandler(
+            gpt_model, vector_store, embed_model, get_db_params(backend), top_k=3, example_store=example_store, backend=backend
+        )
         schemas = handler.get_semantic_schemas(user_prompt)
-        output = handler.generate_sql_query(schemas, user_prompt, context=context_prompt)
+        handler.generate_initial_query(schemas, user_prompt, context=context_prompt)
+        output = handler.generate_validated_sql_query(
+            explain=True, race_models=race_models, fallback_models=fallback_models
+        )
+        if "RACE" in output:
+            logger.info(f"Winning Model: {output['RACE']['WINNER']}")
+        logger.info(f"SQL validated after {output['ATTEMPTS']} attempt(s)")
+        log_generated_query(user_prompt, output["SQL_QUERY"], model=output["MODEL"], source="cli")
         return output["SQL_QUERY"]
     except Exception as e:
         logger.exception(f"Error in SQL Query Generation: {e}")
         exit(1)
 
 
-def execute_sql_on_postgres(query: str, params=None) -> pd.DataFrame:
+def execute_sql_on_postgres(query: str, params=None):
     """Execute SQL query on PostgreSQL database and return result as DataFrame."""
+    with timed_import("pandas/psycopg2"):
+        import pandas as pd
+        import psycopg2
+    with timed_import("cost_guard"):
+        from cost_guard import guard_query
+
     try:
         connection = psycopg2.connect(
             host=DB_HOST,
@@ -66,7 +175,15 @@ def execute_sql_on_postgres(query: str, params=None) -> pd.DataFrame:
             password=DB_PASSWORD,
             port=DB_PORT
         )
-        df = pd.read_sql_query(query, connection, params=params)
+        connection.set_session(readonly=True)
+        guard = guard_query(connection, query)
+        if guard["ACTION"] == "rejected":
+            connection.close()
+            logger.error(f"Query rejected by cost guard: {guard['REASON']}")
+            exit(1)
+        if guard["ACTION"] == "rewritten":
+            logger.info(f"Query rewritten by cost guard: {guard['SQL_QUERY']}")
+        df = pd.read_sql_query(guard["SQL_QUERY"], connection, params=params)
         connection.close()
         return df
     except Exception as e:
@@ -74,27 +191,101 @@ def execute_sql_on_postgres(query: str, params=None) -> pd.DataFrame:
         exit(1)
 
 
-embed_model = "text-embedding-3-small"
-sql_query = generate_sql_query(user_prompt, vector_store, gpt_model, embed_model)
+def execute_sql_on_duckdb(query: str, params=None):
+    """Execute SQL query on embedded DuckDB over the Parquet files and return result as DataFrame."""
+    with timed_import("duckdb"):
+        from duckdb_backend import execute_sql
+
+    try:
+        return execute_sql(PARQUET_DIR, query, params)
+    except Exception as e:
+        logger.exception(f"Error executing SQL on DuckDB: {e}")
+        exit(1)
+
+
+def execute_sql_progressively(query: str, backend: str):
+    """Print a sample-based estimate with error bounds as soon as it is ready, then return the exact result."""
+    with timed_import("query_llm"):
+        from query_llm import LLMQueryHandler
+    with timed_import("approximate"):
+        from approximate import run_progressive
+
+    handler = LLMQueryHandler(None, None, None, get_db_params(backend), backend=backend)
+    run = run_progressive(lambda sql: handler.execute_sql_on_db(sql, guard=True), query, dialect=backend)
+    if run["ESTIMATE"] is not None:
+        print(f"Early estimate from a {run['SAMPLE_PERCENT']:g}% sample (*_error = 95% bound):", file=sys.stderr)
+        print(run["ESTIMATE"].to_string(index=False), file=sys.stderr, flush=True)
+    else:
+        logger.info(f"No early estimate: {run['REASON']}")
+
+    df, error = run["EXACT"].result()
+    if error is not None:
+        logger.error(f"Error executing SQL: {error}")
+        exit(1)
+    return df
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.backend == "duckdb":
+        if not OUTPUT_DATA_PATH:
+            logger.error("Environment variable OUTPUT_DATA_PATH is missing")
+            raise ValueError("Missing environment variable OUTPUT_DATA_PATH")
+    elif not all([DB_HOST, DB_NAME, DB_USER, DB_PASSWORD, OUTPUT_DATA_PATH]):
+        logger.error("Environment variables for DB or OUTPUT_DATA_PATH are missing")
+        raise ValueError("Missing environment variables for DB or OUTPUT_DATA_PATH")
+
+    user_prompt = args.user_prompt
+    vector_store = args.vector_store
+    gpt_model = args.gpt_model
+    race_models = [m.strip() for m in args.race_models.split(",") if m.strip()]
+    fallback_models = [m.strip() for m in args.fallback_models.split(",") if m.strip()]
+
+    logger.info(f"User Prompt: {user_prompt}")
+    logger.info(f"Vector Store: {vector_store}")
+    logger.info(f"GPT Model: {gpt_model}")
+    logger.info(f"Backend: {args.backend}")
+    if race_models:
+        logger.info(f"Race Models: {race_models}, Fallback Models: {fallback_models}")
+
+    embed_model = "text-embedding-3-small"
+    sql_query = generate_sql_query(
+        user_prompt, vector_store, gpt_model, embed_model, race_models, fallback_models, args.backend
+    )
+
+    if sql_query is None:
+        logger.error("SQL Query Generation Failed. Exiting.")
+        exit(1)
+
+    logger.info(f"Generated SQL Query: {sql_query}")
+
+    if args.approximate:
+        df = execute_sql_progressively(sql_query, args.backend)
+    elif args.backend == "duckdb":
+        df = execute_sql_on_duckdb(sql_query)
+    else:
+        df = execute_sql_on_postgres(sql_query)
 
-if sql_query is None:
-    logger.error("SQL Query Generation Failed. Exiting.")
-    exit(1)
+    # Save output with hash + timestamp
+    user_prompt_sanitized = sanitize_filename(user_prompt)
+    sql_query_hash = get_text_hash(sql_query)
+    timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-logger.info(f"Generated SQL Query: {sql_query}")
+    output_file_name = f"query_result_{timestamp_str}_{user_prompt_sanitized}_{sql_query_hash}.csv"
+    os.makedirs(OUTPUT_DATA_PATH, exist_ok=True)
+    output_file_path = os.path.join(OUTPUT_DATA_PATH, output_file_name)
 
-# Run query on PostgreSQL
-df = execute_sql_on_postgres(sql_query)
+    df.to_csv(output_file_path, index=False)
 
-# Save output with hash + timestamp
-user_prompt_sanitized = sanitize_filename(user_prompt)
-sql_query_hash = get_text_hash(sql_query)
-timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+    logger.info(f"Data saved to {output_file_name}")
 
-output_file_name = f"query_result_{timestamp_str}_{user_prompt_sanitized}_{sql_query_hash}.csv"
-os.makedirs(OUTPUT_DATA_PATH, exist_ok=True)
-output_file_path = os.path.join(OUTPUT_DATA_PATH, output_file_name)
+    total_ms = report_import_timings()
+    if args.profile_imports:
+        for label, ms in sorted(import_timings.items(), key=lambda item: -item[1]):
+            print(f"import {label:<20} {ms:8.1f} ms", file=sys.stderr)
+        print(f"{'total':<27} {total_ms:8.1f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)", file=sys.stderr)
 
-df.to_csv(output_file_path, index=False)
 
-logger.info(f"Data saved to {output_file_name}")
+if __name__ == "__main__":
+    main()
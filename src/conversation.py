@@ -0,0 +1,180 @@
+import copy
+import os
+import re
+import duckdb
+import pandas as pd
+from sql_validation import validate_sql
+from utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Recent turns replayed verbatim to the model; older turns are summarised.
+MAX_HISTORY_TURNS = int(os.environ.get("CONVERSATION_MAX_TURNS", 3))
+MAX_SUMMARY_CHARS = int(os.environ.get("CONVERSATION_SUMMARY_CHARS", 1500))
+# Results larger than this are not kept in memory for follow-ups.
+MAX_CACHED_ROWS = int(os.environ.get("CONVERSATION_MAX_CACHED_ROWS", 200_000))
+
+CACHED_TABLE = "previous_result"
+
+# Follow-ups that narrow, reorder or re-aggregate the previous answer.
+REFINEMENT_PATTERN = re.compile(
+    r"^\s*(now|only|just|then|and|also|sort|order|rank|filter|exclude|remove|limit|show only|keep|"
+    r"top\s+\d+|bottom\s+\d+|first\s+\d+|group|same but|of those|of these|from (those|these|that))\b",
+    re.IGNORECASE,
+)
+
+
+def is_refinement(question: str) -> bool:
+    return REFINEMENT_PATTERN.search(question) is not None
+
+
+class Conversation:
+    """
+    Multi-turn question answering on top of an LLMQueryHandler.
+
+    History sent to the model is bounded: the last MAX_HISTORY_TURNS turns are
+    replayed as messages and older ones are folded into a short summary.
+    Follow-ups that refine the previous answer are first tried as DuckDB SQL
+    over the cached result DataFrame; the full retrieve -> generate -> execute
+    cycle runs only when that is not possible.
+    """
+
+    def __init__(self, handler, context: str, max_turns: int = MAX_HISTORY_TURNS):
+        self.handler = handler
+        self.context = context
+        self.max_turns = max_turns
+        self.turns = []
+        self.summary_lines = []
+        self.last_result = None
+        self.pending_sql = None
+
+    def ask(self, question: str) -> dict:
+        """Answer a question; the result has "SQL_QUERY", "DATAFRAME", "SOURCE" ("cache" or "database") and "ERROR"."""
+        if self.pending_sql is not None and is_refinement(question):
+            self.last_result = self._load_result(self.pending_sql)
+            self.pending_sql = None
+        if self.last_result is not None and is_refinement(question):
+            result = self._answer_from_cache(question)
+            if result is not None:
+                return result
+        return self._answer_from_database(question)
+
+    def record_turn(self, question: str, sql_query: str, result: pd.DataFrame = None, lazy: bool = False):
+        """
+        Add a turn answered elsewhere (e.g. the first Streamlit query) to the history.
+        With `lazy=True` and no `result`, the result is only fetched (through the
+        cost guard) when the first refining follow-up needs it.
+        """
+        self.turns.append({"question": question, "sql": sql_query, "rows": None if result is None else len(result)})
+        while len(self.turns) > self.max_turns:
+            self._summarize(self.turns.pop(0))
+        self.last_result = result if result is not None and len(result) <= MAX_CACHED_ROWS else None
+        self.pending_sql = sql_query if lazy and result is None else None
+
+    def _load_result(self, sql_query: str) -> pd.DataFrame | None:
+        handler = self.handler
+        handler.last_guard = None
+        df, error = handler.execute_sql_on_db(sql_query, guard=True)
+        if error is not None or not self._complete():
+            logger.info(f"Previous result not cached for follow-ups: {error or handler.last_guard['ACTION']}")
+            return None
+        return df if len(df) <= MAX_CACHED_ROWS else None
+
+    def _complete(self) -> bool:
+        """Whether the handler's last guarded query ran unchanged; a result truncated by the guard's LIMIT cannot answer follow-ups."""
+        return self.handler.last_guard is None or self.handler.last_guard["ACTION"] == "ok"
+
+    def _answer_from_database(self, question: str) -> dict:
+        handler = self.handler
+        handler.messages = []
+        schemas = handler.get_semantic_schemas(question)
+        context = self.context
+        if self.summary_lines:
+            context += "\n\nEarlier in this conversation:\n" + "\n".join(self.summary_lines)
+        handler.generate_initial_query(schemas, question, context=context)
+
+        # Replay recent turns before the new question.
+        history = []
+        for turn in self.turns:
+            history.append({"role": "user", "content": turn["question"]})
+            history.append({"role": "assistant", "content": turn["sql"]})
+        handler.messages[-1:-1] = history
+
+        output = handler.generate_validated_sql_query()
+        handler.last_guard = None
+        df, error = handler.execute_sql_on_db(output["SQL_QUERY"], guard=True)
+        if handler.last_guard is not None:
+            output["SQL_QUERY"] = handler.last_guard["SQL_QUERY"]
+        if error is None:
+            self.record_turn(question, output["SQL_QUERY"], df if self._complete() else None)
+        return {"SQL_QUERY": output["SQL_QUERY"], "DATAFRAME": df, "SOURCE": "database", "ERROR": error}
+
+    def _answer_from_cache(self, question: str) -> dict | None:
+        previous = self.last_result
+        columns = ", ".join(f"{name} ({dtype})" for name, dtype in previous.dtypes.astype(str).items())
+        refiner = copy.copy(self.handler)
+        refiner.messages = [{"role": "user", "content": question}]
+        refiner.system_prompt = f"""
+        You are an expert SQL assistant. Write a single DuckDB SQL query over the table
+        {CACHED_TABLE} with columns: {columns}.
+        {CACHED_TABLE} holds the result of this query: {self.turns[-1]["sql"]}
+        The previous question was: {self.turns[-1]["question"]}
+
+        - Answer the follow-up using only {CACHED_TABLE}.
+        - If it needs data that is not in {CACHED_TABLE}, reply with CANNOT.
+        - Do NOT explain, only return SQL.
+        """
+        try:
+            output = refiner.generate_sql_query()
+            if "CANNOT" in output["SQL_QUERY"]:
+                return None
+            sql_query, errors = validate_sql(output["SQL_QUERY"], {CACHED_TABLE: {c.lower() for c in previous.columns}})
+            if errors:
+                logger.info(f"Cached follow-up SQL rejected, falling back to database: {errors}")
+                return None
+            con = duckdb.connect()
+            try:
+                con.register(CACHED_TABLE, previous)
+                df = con.execute(sql_query).df()
+            finally:
+                con.close()
+        except Exception as e:
+            logger.info(f"Cached follow-up failed, falling back to database: {e}")
+            return None
+
+        logger.info(f"Answered follow-up from cached result: {sql_query}")
+        self.record_turn(question, f"-- over {CACHED_TABLE}\n{sql_query}", df)
+        return {"SQL_QUERY": sql_query, "DATAFRAME": df, "SOURCE": "cache", "ERROR": None}
+
+    def _summarize(self, turn: dict):
+        rows = "" if turn["rows"] is None else f" ({turn['rows']} rows)"
+        self.summary_lines.append(f"- {turn['question']} -> {' '.join(turn['sql'].split())}{rows}")
+        while self.summary_lines and sum(len(line) for line in self.summary_lines) > MAX_SUMMARY_CHARS:
+            self.summary_lines.pop(0)
+
+
+if __name__ == "__main__":
+    from query_llm import LLMQueryHandler
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    db_params = {
+        "host": os.getenv("DB_HOST"),
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "port": os.getenv("DB_PORT", 5432),
+    }
+    with open(os.getenv("CONTEXT_FILE", "data/context.txt"), "r") as f:
+        context = f.read()
+    handler = LLMQueryHandler(
+        os.getenv("GPT_MODEL", "gpt-4o-mini"), "pinecone", os.getenv("EMBED_MODEL", "text-embedding-3-small"), db_params, top_k=3
+    )
+    conversation = Conversation(handler, context)
+    while True:
+        question = input("> ").strip()
+        if not question:
+            break
+        answer = conversation.ask(question)
+        print(f"[{answer['SOURCE']}] {answer['SQL_QUERY']}")
+        print(answer["ERROR"] or answer["DATAFRAME"])
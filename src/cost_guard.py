@@ -0,0 +1,132 @@
+import os
+import sqlglot
+from sqlglot import exp
+from utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Planner estimates above these budgets are rewritten or rejected.
+MAX_QUERY_COST = float(os.environ.get("MAX_QUERY_COST", 1_000_000))
+MAX_QUERY_ROWS = int(os.environ.get("MAX_QUERY_ROWS", 100_000))
+DEFAULT_QUERY_LIMIT = int(os.environ.get("DEFAULT_QUERY_LIMIT", 1000))
+# Sequential scans estimated above this many rows are reported as hot spots.
+LARGE_SCAN_ROWS = int(os.environ.get("LARGE_SCAN_ROWS", 100_000))
+
+
+def explain_plan(conn, sql: str) -> dict:
+    """Return the root plan node from `EXPLAIN (FORMAT JSON)`; the query is not executed."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+            return cur.fetchone()[0][0]["Plan"]
+    finally:
+        conn.rollback()
+
+
+def plan_stats(plan: dict) -> dict:
+    """Summarise a plan: estimated cost and rows, large sequential scans and cartesian joins."""
+    stats = {
+        "total_cost": plan["Total Cost"],
+        "plan_rows": plan["Plan Rows"],
+        "seq_scans": [],
+        "cross_joins": [],
+        "aggregates_over_scan": False,
+    }
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        children = node.get("Plans", [])
+        node_type = node["Node Type"]
+        if node_type == "Seq Scan" and node["Plan Rows"] >= LARGE_SCAN_ROWS:
+            stats["seq_scans"].append(
+                {"relation": node.get("Relation Name"), "rows": node["Plan Rows"], "filter": node.get("Filter")}
+            )
+        if node_type == "Nested Loop" and "Join Filter" not in node and not any(
+            _parameterized(child) for child in children
+        ):
+            stats["cross_joins"].append({"rows": node["Plan Rows"], "cost": node["Total Cost"]})
+        if node_type == "Aggregate" and any(child["Node Type"] == "Seq Scan" for child in children):
+            stats["aggregates_over_scan"] = True
+        nodes.extend(children)
+    return stats
+
+
+def guard_query(
+    conn,
+    sql: str,
+    max_cost: float = MAX_QUERY_COST,
+    max_rows: int = MAX_QUERY_ROWS,
+    default_limit: int = DEFAULT_QUERY_LIMIT,
+) -> dict:
+    """
+    Check a query's plan against cost and row budgets before it runs.
+
+    Over-budget queries get a LIMIT and are re-planned; PostgreSQL already pushes
+    predicates down wherever that keeps the result the same, so no other rewrite
+    is attempted. Queries that are still over budget, or that contain a cartesian
+    join whose own estimated rows or cost exceed the budget, are rejected with a
+    suggestion. Small cartesian joins (e.g. against a one-row aggregate) are allowed.
+
+    Returns:
+    ----
+    - dict with "SQL_QUERY" (possibly rewritten), "ACTION" ("ok", "rewritten"
+      or "rejected"), "STATS" from `plan_stats` and "REASON".
+    """
+    stats = plan_stats(explain_plan(conn, sql))
+    result = {"SQL_QUERY": sql, "ACTION": "ok", "STATS": stats, "REASON": None}
+
+    oversized_cross_joins = [
+        join for join in stats["cross_joins"] if join["cost"] > max_cost or join["rows"] > max_rows
+    ]
+    if oversized_cross_joins:
+        result.update(ACTION="rejected", REASON="The query contains a cross join; add a join condition.")
+    elif _within_budget(stats, max_cost, max_rows):
+        pass
+    else:
+        try:
+            tree = sqlglot.parse_one(sql, read="postgres")
+            rewritten_sql = _add_limit(tree, default_limit).sql(dialect="postgres")
+        except Exception as e:
+            logger.info(f"Skipping LIMIT rewrite: {e}")
+            rewritten_sql = sql
+        if rewritten_sql != sql:
+            result.update(SQL_QUERY=rewritten_sql, ACTION="rewritten")
+            result["STATS"] = plan_stats(explain_plan(conn, rewritten_sql))
+        if not _within_budget(result["STATS"], max_cost, max_rows):
+            result.update(ACTION="rejected", REASON=_suggestion(result["STATS"], max_cost, max_rows))
+
+    log = logger.warning if result["ACTION"] == "rejected" else logger.info
+    log(f"Cost guard {result['ACTION']}: stats={result['STATS']} reason={result['REASON']} query={result['SQL_QUERY']}")
+    return result
+
+
+def _parameterized(node: dict) -> bool:
+    """Whether a join input is restricted by the outer row, looking through Memoize/Materialize wrappers."""
+    if any(key in node for key in ("Index Cond", "Filter", "Recheck Cond", "Cache Key")):
+        return True
+    if node["Node Type"] in ("Memoize", "Materialize"):
+        return any(_parameterized(child) for child in node.get("Plans", []))
+    return False
+
+
+def _within_budget(stats: dict, max_cost: float, max_rows: int) -> bool:
+    return stats["total_cost"] <= max_cost and stats["plan_rows"] <= max_rows
+
+
+def _add_limit(tree: exp.Expression, limit: int) -> exp.Expression:
+    if tree.args.get("limit") is not None:
+        return tree
+    return tree.limit(limit)
+
+
+def _suggestion(stats: dict, max_cost: float, max_rows: int) -> str:
+    reason = (
+        f"Estimated cost {stats['total_cost']:.0f} / rows {stats['plan_rows']} "
+        f"exceed the budget of {max_cost:.0f} / {max_rows}."
+    )
+    relations = sorted({scan["relation"] for scan in stats["seq_scans"] if scan["relation"]})
+    if stats["aggregates_over_scan"] and relations:
+        reason += f" Consider a pre-aggregated table over {', '.join(relations)}."
+    elif relations:
+        reason += f" Add selective filters or indexes on {', '.join(relations)}."
+    return reason
@@ -1,6 +1,7 @@
 import clickhouse_connect
 import os
 import pandas as pd
+from schema_inference import infer_schema, pandas_dtypes
 
 # Path to your cricket dataset (CSV)
 path_to_cricket_csv = "data/cricket_data.csv"
@@ -39,8 +40,8 @@ ORDER BY (match_id, inning, over, ball)
 # Execute table creation
 client.command(create_cricket_table)
 
-# Load CSV using pandas
-df = pd.read_csv(path_to_cricket_csv)
+# Load CSV using pandas with compact dtypes (int8, category, ...)
+df = pd.read_csv(path_to_cricket_csv, dtype=pandas_dtypes(infer_schema(path_to_cricket_csv)))
 
 # Insert into ClickHouse
 client.insert_df(
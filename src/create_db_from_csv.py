@@ -1,12 +1,13 @@
 import os
 import glob
 import pandas as pd
-import logging
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from schema_inference import infer_schema, pandas_dtypes, to_postgres_ddl, write_schema_file
+from utils import setup_logger
 
-logging.basicConfig(level=logging.INFO)
+logger = setup_logger(__name__)
 
-def create_db_from_csv(path_to_csv_dir, username, password, host, port, dbname):
+def create_db_from_csv(path_to_csv_dir, username, password, host, port, dbname, schema_file=None, use_enums=False, chunksize=100_000):
     # Build dynamic PostgreSQL connection URL
     db_url = f"postgresql://{username}:{password}@{host}:{port}/{dbname}"
 
@@ -14,16 +15,33 @@ def create_db_from_csv(path_to_csv_dir, username, password, host, port, dbname):
     engine = create_engine(db_url)
 
     csv_files = glob.glob(os.path.join(path_to_csv_dir, "*.csv"))
+    ddls = []
 
     for csv_file in csv_files:
         table_name = os.path.basename(csv_file).split(".")[0]
-        logging.info(f"Creating Table {table_name}")
+        logger.info(f"Creating Table {table_name}")
         try:
-            df = pd.read_csv(csv_file)
-            df.to_sql(name=table_name, con=engine, if_exists="replace", index=False)
-            logging.info(f"Table {table_name} created successfully.")
+            # Infer compact types first so the table is created with them
+            # instead of letting to_sql default to TEXT/BIGINT.
+            schema = infer_schema(csv_file, chunksize=chunksize)
+            ddl = to_postgres_ddl(table_name, schema, use_enums=use_enums)
+            with engine.begin() as conn:
+                conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}" CASCADE'))
+                for statement in ddl.split(";\n"):
+                    if statement.startswith("CREATE TYPE"):
+                        conn.execute(text(f"DROP TYPE IF EXISTS {statement.split()[2]} CASCADE"))
+                    conn.execute(text(statement.rstrip(";")))
+
+            for df in pd.read_csv(csv_file, dtype=pandas_dtypes(schema), chunksize=chunksize):
+                df.to_sql(name=table_name, con=engine, if_exists="append", index=False)
+            ddls.append(ddl)
+            logger.info(f"Table {table_name} created successfully.")
         except Exception as e:
-            logging.error(f"Error Processing File {csv_file}: {e}")
+            logger.error(f"Error Processing File {csv_file}: {e}")
+
+    if schema_file:
+        write_schema_file(ddls, schema_file)
+        logger.info(f"Schema written to {schema_file}")
 
 if __name__ == "__main__":
     # Take user inputs for PostgreSQL connection
@@ -35,5 +53,6 @@ if __name__ == "__main__":
 
     # Path to cricket CSV files
     path_to_csv_dir = input("Enter path to cricket CSV folder: ")
+    schema_file = input("Enter path to write the schema file (optional): ") or None
 
-    create_db_from_csv(path_to_csv_dir, username, password, host, port, dbname)
+    create_db_from_csv(path_to_csv_dir, username, password, host, port, dbname, schema_file=schema_file)
@@ -0,0 +1,104 @@
+import os
+import glob
+import shutil
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from schema_inference import infer_schema, pandas_dtypes
+from utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Directory (hive) partitioning column, when a table has it.
+PARTITION_COLUMN = "season"
+# Tables without it are sorted on this column so row-group min/max statistics
+# let DuckDB skip row groups on match_id filters without creating tiny files.
+SORT_COLUMN = "match_id"
+
+
+def create_parquet_from_csv(path_to_csv_dir: str, parquet_dir: str, chunksize: int = 500_000, row_group_size: int = 128_000):
+    """
+    Convert every CSV in `path_to_csv_dir` to Parquet under `parquet_dir/<table>/`
+    using the compact dtypes from `schema_inference`.
+
+    Each table is written to a temporary directory and swapped in only when the
+    conversion succeeds, so a failed run never leaves a truncated table behind.
+    """
+    csv_files = glob.glob(os.path.join(path_to_csv_dir, "*.csv"))
+
+    for csv_file in csv_files:
+        table_name = os.path.basename(csv_file).split(".")[0]
+        table_dir = os.path.join(parquet_dir, table_name)
+        tmp_dir = f"{table_dir}.tmp"
+        logger.info(f"Converting {csv_file} to Parquet")
+        try:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            schema = infer_schema(csv_file, chunksize=chunksize)
+            _write_table(csv_file, tmp_dir, schema, chunksize, row_group_size)
+            _replace_dir(tmp_dir, table_dir)
+            logger.info(f"Table {table_name} written to {table_dir}")
+        except Exception as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            logger.error(f"Error Processing File {csv_file}: {e}")
+
+
+def _write_table(csv_file: str, out_dir: str, schema: dict, chunksize: int, row_group_size: int):
+    dtypes = pandas_dtypes(schema)
+    if PARTITION_COLUMN in schema:
+        # One file per chunk and season; each file is sorted on its own.
+        for i, df in enumerate(pd.read_csv(csv_file, dtype=dtypes, chunksize=chunksize)):
+            if SORT_COLUMN in df.columns:
+                df = df.sort_values(SORT_COLUMN, kind="stable")
+            pq.write_to_dataset(
+                pa.Table.from_pandas(df, preserve_index=False),
+                root_path=out_dir,
+                partition_cols=[PARTITION_COLUMN],
+                basename_template=f"part-{i}-{{i}}.parquet",
+                row_group_size=row_group_size,
+            )
+        return
+
+    path = os.path.join(out_dir, "data.parquet")
+    unsorted_path = f"{path}.unsorted" if SORT_COLUMN in schema else path
+    writer = None
+    try:
+        for df in pd.read_csv(csv_file, dtype=dtypes, chunksize=chunksize):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(unsorted_path, table.schema)
+            writer.write_table(table, row_group_size=row_group_size)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if unsorted_path != path:
+        # Sort the whole file, not chunk by chunk, so row groups cover disjoint
+        # match_id ranges. DuckDB spills to disk when the table exceeds memory.
+        con = duckdb.connect()
+        try:
+            source = unsorted_path.replace("'", "''")
+            target = path.replace("'", "''")
+            con.execute(
+                f"COPY (SELECT * FROM read_parquet('{source}') ORDER BY \"{SORT_COLUMN}\") "
+                f"TO '{target}' (FORMAT PARQUET, ROW_GROUP_SIZE {int(row_group_size)})"
+            )
+        finally:
+            con.close()
+        os.remove(unsorted_path)
+
+
+def _replace_dir(tmp_dir: str, table_dir: str):
+    old_dir = f"{table_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(table_dir):
+        os.replace(table_dir, old_dir)
+    os.replace(tmp_dir, table_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    path_to_csv_dir = input("Enter path to cricket CSV folder: ")
+    parquet_dir = input("Enter output Parquet folder (default: data/parquet): ") or "data/parquet"
+    create_parquet_from_csv(path_to_csv_dir, parquet_dir)
@@ -11,6 +11,7 @@ import re
 from dotenv import load_dotenv
 import os
 from utils import check_valid_vector_store
+from index_aliases import live_index_names
 
 load_dotenv()
 
@@ -138,6 +139,12 @@ def create_cricket_database(
     if openai_api_key is None:
         raise ValueError("OPENAI_API_KEY must be set in environment.")
 
+    # Writing into a live index would mix old and new schema vectors under queries.
+    if index_name is not None and index_name in live_index_names():
+        raise ValueError(
+            f"Index '{index_name}' is live behind an alias; rebuild it with index_lifecycle.rebuild instead."
+        )
+
     vector_store = initialize_vector_store(
         vector_store_name, pinecone_api_key, pinecone_config, index_name
     )
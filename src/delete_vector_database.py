@@ -1,27 +1,19 @@
 import os
-import logging
 from dotenv import load_dotenv
-import pinecone
+from pinecone import Pinecone
+from index_aliases import live_index_names
+from utils import setup_logger
 
 # Load environment variables
 load_dotenv()
 
-# Setup logger
-def setup_logger(name):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    if not logger.hasHandlers():
-        logger.addHandler(handler)
-    return logger
-
 logger = setup_logger(__name__)
 
 def delete_database(index_name: str, vector_store: str = "pinecone"):
     """
     Deletes an index from Pinecone.
+    Indexes currently served through an alias are refused; use
+    `index_lifecycle.garbage_collect` to remove old versions.
 
     Parameters:
     ---
@@ -29,13 +21,16 @@ def delete_database(index_name: str, vector_store: str = "pinecone"):
     - vector_store (str, optional): Currently only supports Pinecone.
     """
     if vector_store == "pinecone":
+        if index_name in live_index_names():
+            logger.error(f"Refusing to delete '{index_name}': it is live behind an alias")
+            return
         try:
             # Initialize Pinecone client
             PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
-            pinecone.init(api_key=PINECONE_API_KEY)
+            pc = Pinecone(api_key=PINECONE_API_KEY)
 
             # Delete the index
-            pinecone.delete_index(index_name)
+            pc.delete_index(index_name)
 
             logger.info(f"Successfully deleted the index '{index_name}' from Pinecone")
 
@@ -44,5 +39,5 @@ def delete_database(index_name: str, vector_store: str = "pinecone"):
 
 
 if __name__ == "__main__":
-    vector_index_to_delete = "CricketIndex"  # change to your index name
+    vector_index_to_delete = "cricket-index"  # change to your index name
     delete_database(vector_index_to_delete)
@@ -0,0 +1,68 @@
+import os
+import threading
+import duckdb
+import pandas as pd
+from schema_inference import write_schema_file
+from utils import setup_logger
+
+logger = setup_logger(__name__)
+
+DUCKDB_THREADS = os.environ.get("DUCKDB_THREADS")  # default: all cores
+
+_connections = {}
+_lock = threading.Lock()
+
+
+def connect(parquet_dir: str) -> duckdb.DuckDBPyConnection:
+    """
+    In-memory DuckDB database with one view per table directory in `parquet_dir`.
+    The connection is shared per directory; use `execute_sql` for per-thread cursors.
+    """
+    with _lock:
+        if parquet_dir not in _connections:
+            con = duckdb.connect(database=":memory:")
+            if DUCKDB_THREADS:
+                con.execute(f"SET threads = {int(DUCKDB_THREADS)}")
+            for table_name in sorted(os.listdir(parquet_dir)):
+                table_dir = os.path.join(parquet_dir, table_name)
+                # "<table>.tmp"/"<table>.old" are in-progress conversions.
+                if not os.path.isdir(table_dir) or "." in table_name:
+                    continue
+                pattern = os.path.join(table_dir, "**", "*.parquet").replace("'", "''")
+                con.execute(
+                    f"CREATE VIEW \"{table_name}\" AS "
+                    f"SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)"
+                )
+                logger.info(f"Registered DuckDB view {table_name}")
+            _connections[parquet_dir] = con
+        return _connections[parquet_dir]
+
+
+def execute_sql(parquet_dir: str, query: str, params=None) -> pd.DataFrame:
+    """Run a query over the Parquet views and return a DataFrame."""
+    # A cursor is an independent connection to the same database, safe to use from this thread.
+    cursor = connect(parquet_dir).cursor()
+    try:
+        return cursor.execute(query, params).df()
+    finally:
+        cursor.close()
+
+
+def schema_ddl(parquet_dir: str) -> list[str]:
+    """CREATE TABLE statements for every view, in the format read by `CricketSchemaParser`."""
+    con = connect(parquet_dir)
+    ddls = []
+    for (table_name,) in con.execute(
+        "SELECT view_name FROM duckdb_views() WHERE NOT internal ORDER BY view_name"
+    ).fetchall():
+        columns = con.execute(f'DESCRIBE "{table_name}"').fetchall()
+        lines = ",\n".join(f"    {name} {column_type}" for name, column_type, *_ in columns)
+        ddls.append(f"CREATE TABLE {table_name} (\n{lines}\n);")
+    return ddls
+
+
+if __name__ == "__main__":
+    parquet_dir = input("Enter Parquet folder (default: data/parquet): ") or "data/parquet"
+    schema_file = input("Enter path to write the schema file: ")
+    write_schema_file(schema_ddl(parquet_dir), schema_file)
+    print(f"Schema written to {schema_file}")
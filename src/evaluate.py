@@ -0,0 +1,193 @@
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from psycopg2.pool import ThreadedConnectionPool
+from query_llm import LLMQueryHandler
+from read_data import iter_query_pairs, DATA_FILE
+from utils import setup_logger
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+DB_PARAMS = {
+    "host": os.getenv("DB_HOST"),
+    "dbname": os.getenv("DB_NAME"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "port": os.getenv("DB_PORT", 5432),
+}
+
+# Column pairings tried by `results_match` when several columns hold the same values.
+MAX_COLUMN_PAIRINGS = 720
+
+RESULT_COLUMNS = [
+    "model", "top_k", "question", "gold_sql", "predicted_sql", "correct", "error",
+    "generation_s", "execution_s", "n_prompt_tokens", "n_generated_tokens", "cost",
+]
+
+
+def results_match(gold: pd.DataFrame, predicted: pd.DataFrame) -> bool:
+    """
+    Compare two result sets ignoring row order, column names and column order.
+    Rows are compared as a multiset of row hashes, so duplicates must match too.
+    Columns holding the same multiset of values (e.g. team1/team2) can be paired
+    either way, so every pairing within such a group is tried, up to MAX_COLUMN_PAIRINGS.
+    """
+    if gold.shape != predicted.shape:
+        return False
+    gold, predicted = _normalize(gold), _normalize(predicted)
+
+    # Group columns by the multiset of values they hold; groups must correspond one to one.
+    gold_groups, predicted_groups = _columns_by_signature(gold), _columns_by_signature(predicted)
+    if {signature: len(columns) for signature, columns in gold_groups.items()} != {
+        signature: len(columns) for signature, columns in predicted_groups.items()
+    }:
+        return False
+    gold_order = [column for columns in gold_groups.values() for column in columns]
+    gold_rows = _row_hashes(gold[gold_order])
+
+    pairings = itertools.product(*(itertools.permutations(predicted_groups[signature]) for signature in gold_groups))
+    for pairing in itertools.islice(pairings, MAX_COLUMN_PAIRINGS):
+        candidate = predicted[[column for columns in pairing for column in columns]]
+        if np.array_equal(gold_rows, _row_hashes(candidate)):
+            return True
+    return False
+
+
+def evaluate_config(
+    pairs: list[tuple[str, str]],
+    model: str,
+    top_k: int,
+    context: str,
+    pool: ThreadedConnectionPool,
+    concurrency: int = 4,
+    vector_store: str = "pinecone",
+    embed_model: str = "text-embedding-3-small",
+) -> pd.DataFrame:
+    """Generate and execute SQL for every pair with `concurrency` workers; one row per question."""
+
+    def run_sql(sql_query: str):
+        start = time.perf_counter()
+        df, error = LLMQueryHandler(model, vector_store, embed_model, DB_PARAMS, connection_pool=pool).execute_sql_on_db(sql_query)
+        return df, error, time.perf_counter() - start
+
+    def evaluate_pair(pair):
+        question, gold_sql = pair
+        row = {"model": model, "top_k": top_k, "question": question, "gold_sql": gold_sql}
+        handler = LLMQueryHandler(model, vector_store, embed_model, DB_PARAMS, top_k=top_k, connection_pool=pool)
+        start = time.perf_counter()
+        try:
+            schemas = handler.get_semantic_schemas(question)
+            handler.generate_initial_query(schemas, question, context=context)
+            output = handler.generate_validated_sql_query()
+        except Exception as e:
+            row.update(generation_s=time.perf_counter() - start, error=f"generation: {e}", correct=False)
+            return row
+        row.update(
+            generation_s=time.perf_counter() - start,
+            predicted_sql=output["SQL_QUERY"],
+            n_prompt_tokens=output["N_PROMPT_TOKENS"],
+            n_generated_tokens=output["N_GENERATED_TOKENS"],
+            cost=handler.calculate_query_execution_cost(
+                output["MODEL"], output["N_PROMPT_TOKENS"], output["N_GENERATED_TOKENS"]
+            ),
+        )
+
+        # Gold and generated SQL run side by side on separate pooled connections.
+        gold_future = sql_executor.submit(run_sql, gold_sql)
+        predicted_df, predicted_error, row["execution_s"] = run_sql(output["SQL_QUERY"])
+        gold_df, gold_error, _ = gold_future.result()
+
+        if gold_error is not None:
+            row.update(error=f"gold: {gold_error}", correct=None)
+        elif predicted_error is not None:
+            row.update(error=f"predicted: {predicted_error}", correct=False)
+        else:
+            row.update(error=None, correct=results_match(gold_df, predicted_df))
+        return row
+
+    with ThreadPoolExecutor(max_workers=concurrency) as sql_executor, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        rows = list(executor.map(evaluate_pair, pairs))
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def summarize(results: pd.DataFrame) -> pd.DataFrame:
+    """Accuracy, latency and cost per configuration; questions whose gold SQL failed are excluded."""
+    scored = results[results["correct"].notna()].copy()
+    scored["correct"] = scored["correct"].astype(bool)
+    return scored.groupby(["model", "top_k"]).agg(
+        questions=("question", "size"),
+        accuracy=("correct", "mean"),
+        generation_p50_s=("generation_s", "median"),
+        generation_p95_s=("generation_s", lambda s: s.quantile(0.95)),
+        execution_p50_s=("execution_s", "median"),
+        prompt_tokens=("n_prompt_tokens", "sum"),
+        generated_tokens=("n_generated_tokens", "sum"),
+        cost=("cost", "sum"),
+    ).reset_index()
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.reset_index(drop=True).copy()
+    df.columns = range(df.shape[1])
+    for column in df.columns:
+        # NUMERIC comes back as Decimal objects; compare all numbers as rounded floats.
+        numeric = pd.to_numeric(df[column], errors="coerce")
+        if numeric.notna().sum() == df[column].notna().sum():
+            df[column] = numeric.astype("float64").round(6)
+        else:
+            df[column] = df[column].astype(str)
+    return df
+
+
+def _column_signature(column: pd.Series) -> bytes:
+    return np.sort(pd.util.hash_pandas_object(column, index=False).to_numpy()).tobytes()
+
+
+def _columns_by_signature(df: pd.DataFrame) -> dict[bytes, list]:
+    groups = {}
+    for column in df.columns:
+        groups.setdefault(_column_signature(df[column]), []).append(column)
+    return groups
+
+
+def _row_hashes(df: pd.DataFrame) -> np.ndarray:
+    return np.sort(pd.util.hash_pandas_object(df, index=False).to_numpy())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure execution accuracy, latency and cost of SQL generation.")
+    parser.add_argument("--data_file", default=DATA_FILE, help="File of input:/output: question-SQL pairs")
+    parser.add_argument("--models", required=True, help="Comma-separated models to evaluate")
+    parser.add_argument("--top_k", default="3", help="Comma-separated top_k values to evaluate")
+    parser.add_argument("--context_file", default=os.getenv("CONTEXT_FILE", "data/context.txt"))
+    parser.add_argument("--limit", type=int, default=None, help="Evaluate only the first N pairs")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions evaluated in parallel")
+    parser.add_argument("--output", default="evaluation_results.csv", help="Per-question results CSV")
+    args = parser.parse_args()
+
+    pairs = list(itertools.islice(iter_query_pairs(args.data_file), args.limit))
+    with open(args.context_file, "r") as f:
+        context = f.read()
+
+    # two connections per worker: gold and generated SQL run concurrently
+    pool = ThreadedConnectionPool(1, 2 * args.concurrency, **DB_PARAMS)
+    all_results = []
+    try:
+        for model, top_k in itertools.product(args.models.split(","), [int(k) for k in args.top_k.split(",")]):
+            logger.info(f"Evaluating model={model} top_k={top_k} on {len(pairs)} questions")
+            all_results.append(evaluate_config(pairs, model.strip(), top_k, context, pool, args.concurrency))
+    finally:
+        pool.closeall()
+
+    results = pd.concat(all_results, ignore_index=True)
+    results.to_csv(args.output, index=False)
+    summary = summarize(results)
+    logger.info(f"Evaluation summary:\n{summary.to_string(index=False)}")
+    print(summary.to_string(index=False))
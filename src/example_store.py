@@ -0,0 +1,191 @@
+import json
+import os
+from array import array
+import numpy as np
+from llama_index.embeddings.openai import OpenAIEmbedding
+from read_data import iter_query_pairs, DATA_FILE
+from rate_limiter import scheduler, BATCH
+from utils import setup_logger
+
+logger = setup_logger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.f16"
+RAW_EMBEDDINGS_FILE = "embeddings.f32.tmp"
+CENTROIDS_FILE = "centroids.npy"
+LISTS_FILE = "lists.npy"
+OFFSETS_FILE = "offsets.npy"
+RECORDS_FILE = "examples.jsonl"
+META_FILE = "meta.json"
+
+# Inverted-file index: examples are clustered into about sqrt(count) lists and a
+# search only scores the lists whose centroids are closest to the question.
+N_PROBE = int(os.environ.get("EXAMPLE_STORE_PROBES", 8))
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+
+
+class ExampleStore:
+    """
+    On-disk store of question/SQL examples for few-shot prompting.
+
+    Layout of `directory`:
+    - embeddings.f16: row-major float16 unit vectors grouped by IVF list, read through a memory map
+    - centroids.npy: float32 unit centroid of each IVF list
+    - lists.npy: first row of each list in embeddings.f16, plus the total count
+    - examples.jsonl: one {"question", "sql"} record per line
+    - offsets.npy: byte offset in examples.jsonl of each row of embeddings.f16
+    - meta.json: count, dimension, number of lists and embedding model
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, META_FILE), "r") as f:
+            self.meta = json.load(f)
+        if "n_lists" not in self.meta:
+            raise ValueError(f"Example store in {directory} has no IVF index; rebuild it with ExampleStore.build.")
+        self.embeddings = np.memmap(
+            os.path.join(directory, EMBEDDINGS_FILE),
+            dtype=np.float16,
+            mode="r",
+            shape=(self.meta["count"], self.meta["dimension"]),
+        )
+        self.centroids = np.load(os.path.join(directory, CENTROIDS_FILE))
+        self.lists = np.load(os.path.join(directory, LISTS_FILE))
+        self.offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        self.records_path = os.path.join(directory, RECORDS_FILE)
+        self.embed_model = OpenAIEmbedding(model=self.meta["embed_model"], api_key=os.environ.get("OPENAI_API_KEY"))
+
+    @classmethod
+    def build(
+        cls,
+        pairs,
+        directory: str,
+        embed_model: str = "text-embedding-3-small",
+        batch_size: int = 256,
+        chunk_rows: int = 65536,
+    ) -> "ExampleStore":
+        """Embed (question, sql) pairs batch by batch into a new store, then build its IVF index."""
+        os.makedirs(directory, exist_ok=True)
+        embedder = OpenAIEmbedding(model=embed_model, embed_batch_size=batch_size, api_key=os.environ.get("OPENAI_API_KEY"))
+        offsets = array("Q")
+        dimension = None
+        raw_path = os.path.join(directory, RAW_EMBEDDINGS_FILE)
+
+        with open(raw_path, "wb") as embeddings_file, open(os.path.join(directory, RECORDS_FILE), "wb") as records_file:
+
+            def flush(batch):
+                questions = [q for q, _ in batch]
+                embeddings = scheduler.submit(
+                    "openai", embed_model, embedder.get_text_embedding_batch, questions,
+                    estimated_tokens=sum(len(q) for q in questions) // 4 + 1,
+                )
+                vectors = np.asarray(embeddings, dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                embeddings_file.write(vectors.tobytes())
+                for question, sql_query in batch:
+                    offsets.append(records_file.tell())
+                    records_file.write((json.dumps({"question": question, "sql": sql_query}) + "\n").encode("utf-8"))
+                return vectors.shape[1]
+
+            batch = []
+            for pair in pairs:
+                batch.append(pair)
+                if len(batch) == batch_size:
+                    dimension = flush(batch)
+                    batch = []
+                    logger.info(f"Indexed {len(offsets)} examples")
+            if batch:
+                dimension = flush(batch)
+
+        if dimension is None:
+            os.remove(raw_path)
+            raise ValueError("No question/SQL pairs to index.")
+
+        count = len(offsets)
+        raw = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(count, dimension))
+        centroids = _train_centroids(raw, max(1, int(np.sqrt(count))), chunk_rows)
+        assignments = np.concatenate(
+            [_nearest(raw[start : start + chunk_rows], centroids) for start in range(0, count, chunk_rows)]
+        )
+        order = np.argsort(assignments, kind="stable")
+        lists = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+
+        # Rewrite the vectors grouped by list so each probed list is one contiguous read.
+        with open(os.path.join(directory, EMBEDDINGS_FILE), "wb") as f:
+            for start in range(0, count, chunk_rows):
+                f.write(raw[order[start : start + chunk_rows]].astype(np.float16).tobytes())
+        del raw
+        os.remove(raw_path)
+
+        np.save(os.path.join(directory, CENTROIDS_FILE), centroids)
+        np.save(os.path.join(directory, LISTS_FILE), lists)
+        np.save(os.path.join(directory, OFFSETS_FILE), np.frombuffer(offsets, dtype=np.uint64)[order])
+        with open(os.path.join(directory, META_FILE), "w") as f:
+            json.dump(
+                {"count": count, "dimension": dimension, "n_lists": len(centroids), "embed_model": embed_model}, f
+            )
+        logger.info(f"Example store with {count} examples in {len(centroids)} lists written to {directory}")
+        return cls(directory)
+
+    def search(self, question: str, top_k: int = 3, n_probe: int = N_PROBE, priority: int = BATCH) -> list[dict]:
+        """Return the `top_k` most similar examples from the `n_probe` lists nearest to the question."""
+        embedding = scheduler.submit(
+            "openai", self.meta["embed_model"], self.embed_model.get_query_embedding, question,
+            estimated_tokens=len(question) // 4 + 1, priority=priority,
+        )
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query)
+
+        n_probe = min(n_probe, len(self.centroids))
+        probed = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        best_scores = np.empty(0, dtype=np.float32)
+        best_ids = np.empty(0, dtype=np.int64)
+        for list_id in probed:
+            start, stop = int(self.lists[list_id]), int(self.lists[list_id + 1])
+            if start == stop:
+                continue
+            scores = self.embeddings[start:stop].astype(np.float32) @ query
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_ids = np.concatenate([best_ids, top + start])
+        keep = np.argsort(-best_scores)[:top_k]
+        best_scores, best_ids = best_scores[keep], best_ids[keep]
+
+        examples = []
+        with open(self.records_path, "rb") as f:
+            for example_id, score in zip(best_ids, best_scores):
+                f.seek(int(self.offsets[example_id]))
+                record = json.loads(f.readline())
+                record["score"] = float(score)
+                examples.append(record)
+        return examples
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.argmax(vectors @ centroids.T, axis=1)
+
+
+def _train_centroids(vectors: np.ndarray, n_lists: int, chunk_rows: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the unit vectors; returns unit centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = np.concatenate(
+            [_nearest(sample[start : start + chunk_rows], centroids) for start in range(0, sample_size, chunk_rows)]
+        )
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = ~sums.any(axis=1)
+        # An empty list restarts from a random sampled vector.
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+    return centroids
+
+
+if __name__ == "__main__":
+    store_dir = os.environ.get("EXAMPLE_STORE_DIR", "data/example_store")
+    store = ExampleStore.build(iter_query_pairs(DATA_FILE), store_dir)
+    for example in store.search("Who scored the most runs in match 12?"):
+        print(f"{example['score']:.3f} {example['question']} -> {example['sql']}")
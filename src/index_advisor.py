@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+from collections import Counter
+import psycopg2
+from psycopg2 import sql
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+from dotenv import load_dotenv
+from sql_validation import validate_sql
+from utils import setup_logger
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+# |pg_stats.correlation| above this means the column follows the physical row
+# order closely enough for a small BRIN index to beat a B-tree.
+BRIN_CORRELATION = 0.9
+# Per-statement cap while replaying the logged workload.
+MEASURE_TIMEOUT_MS = int(os.environ.get("INDEX_ADVISOR_TIMEOUT_MS", 30_000))
+
+
+def load_query_log(path: str) -> list[str]:
+    """
+    Read generated SQL from the JSONL query log written by `utils.log_generated_query`.
+    Application log files (JSON or text) containing "Generated SQL Query:" lines are accepted too.
+    """
+    queries = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                if "sql_query" in record:
+                    queries.append(record["sql_query"])
+                    continue
+                # structured application log record
+                line = record.get("message", "")
+            # JSON messages keep the SQL's own line breaks.
+            match = re.search(r"Generated SQL Query:\s*(.+)$", line, re.S)
+            if match:
+                queries.append(match.group(1).strip())
+    return queries
+
+
+def extract_column_usage(sql_query: str) -> Counter:
+    """Count (table, column, role) triples where role is "filter", "join" or "group"."""
+    usage = Counter()
+    try:
+        tree = sqlglot.parse_one(sql_query, read="postgres")
+    except ParseError:
+        logger.info(f"Skipping unparsable query: {sql_query}")
+        return usage
+
+    for select in tree.find_all(exp.Select):
+        aliases = {
+            table.alias_or_name.lower(): table.name.lower()
+            for table in select.find_all(exp.Table)
+            if table.find_ancestor(exp.Select) is select
+        }
+        roles = [("filter", select.args.get("where")), ("group", select.args.get("group"))]
+        roles += [("join", join.args.get("on")) for join in select.args.get("joins") or []]
+        for role, clause in roles:
+            if clause is None:
+                continue
+            for column in clause.find_all(exp.Column):
+                table = _resolve_table(column, aliases)
+                if table:
+                    usage[(table, column.name.lower(), role)] += 1
+    return usage
+
+
+def recommend_indexes(conn, usage: Counter, min_count: int = 2) -> list[dict]:
+    """
+    Propose indexes for frequently filtered/joined/grouped columns that have none,
+    and integer types for numeric columns stored as text.
+    """
+    column_counts = Counter()
+    for (table, column, _), count in usage.items():
+        column_counts[(table, column)] += count
+
+    recommendations = []
+    with conn.cursor() as cur:
+        for (table, column), count in column_counts.most_common():
+            if count < min_count or not _column_exists(cur, table, column):
+                continue
+            if not _has_index(cur, table, column):
+                method = "brin" if abs(_correlation(cur, table, column)) >= BRIN_CORRELATION else "btree"
+                statement = sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING {} ({})").format(
+                    sql.Identifier(f"idx_{table}_{column}"[:63]),
+                    sql.Identifier(table),
+                    sql.SQL(method),
+                    sql.Identifier(column),
+                )
+                recommendations.append(
+                    {"table": table, "column": column, "uses": count, "kind": method, "ddl": statement.as_string(conn)}
+                )
+            if _is_integer_text_column(cur, table, column):
+                statement = sql.SQL("ALTER TABLE {} ALTER COLUMN {} TYPE integer USING {}::integer").format(
+                    sql.Identifier(table), sql.Identifier(column), sql.Identifier(column)
+                )
+                recommendations.append(
+                    {"table": table, "column": column, "uses": count, "kind": "type", "ddl": statement.as_string(conn)}
+                )
+    conn.rollback()
+    return recommendations
+
+
+def apply_recommendations(conn, recommendations: list[dict]):
+    """Run the proposed DDL; type changes go first so indexes are built on the final type."""
+    with conn.cursor() as cur:
+        for recommendation in sorted(recommendations, key=lambda r: r["kind"] != "type"):
+            logger.info(f"Applying: {recommendation['ddl']}")
+            cur.execute(recommendation["ddl"])
+        cur.execute("ANALYZE")
+    conn.commit()
+
+
+def measure_workload(conn, queries: list[str], repeat: int = 3, timeout_ms: int = MEASURE_TIMEOUT_MS) -> dict:
+    """
+    Median wall-clock latency in seconds per distinct query, plus the workload total.
+    Logged SQL (possibly scraped from free-text logs) must pass `validate_sql` and
+    runs in a read-only transaction with a statement timeout.
+    """
+    timings = {}
+    with conn.cursor() as cur:
+        for query in dict.fromkeys(queries):
+            cleaned_sql, errors = validate_sql(query)
+            if errors:
+                logger.info(f"Skipping logged query that failed validation: {errors}")
+                continue
+            samples = []
+            try:
+                conn.rollback()
+                cur.execute("SET TRANSACTION READ ONLY")
+                cur.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    cur.execute(cleaned_sql)
+                    cur.fetchall()
+                    samples.append(time.perf_counter() - start)
+            except Exception as e:
+                logger.info(f"Skipping query that failed to run: {e}")
+                conn.rollback()
+                continue
+            timings[query] = statistics.median(samples)
+    conn.rollback()
+    return {"queries": timings, "total": sum(timings.get(query, 0.0) for query in queries)}
+
+
+def _resolve_table(column: exp.Column, aliases: dict[str, str]) -> str | None:
+    qualifier = column.table.lower()
+    if qualifier:
+        return aliases.get(qualifier)
+    # An unqualified column is unambiguous only when a single table is in scope.
+    tables = set(aliases.values())
+    return tables.pop() if len(tables) == 1 else None
+
+
+def _column_exists(cur, table: str, column: str) -> bool:
+    cur.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+        (table, column),
+    )
+    return cur.fetchone() is not None
+
+
+def _has_index(cur, table: str, column: str) -> bool:
+    # Only indexes whose leading column is `column` help lookups on it.
+    cur.execute(
+        """
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = %s::regclass AND a.attname = %s
+        """,
+        (table, column),
+    )
+    return cur.fetchone() is not None
+
+
+def _correlation(cur, table: str, column: str) -> float:
+    cur.execute(
+        "SELECT correlation FROM pg_stats WHERE tablename = %s AND attname = %s",
+        (table, column),
+    )
+    row = cur.fetchone()
+    return row[0] if row and row[0] is not None else 0.0
+
+
+def _is_integer_text_column(cur, table: str, column: str) -> bool:
+    cur.execute(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+        (table, column),
+    )
+    if cur.fetchone()[0] not in ("text", "character varying"):
+        return False
+    # Every row is checked: one non-integer value would make the cast, and the
+    # whole apply transaction, fail.
+    cur.execute(
+        sql.SQL("SELECT bool_and({col} ~ '^-?[0-9]{{1,9}}$') FROM {tbl} WHERE {col} IS NOT NULL").format(
+            col=sql.Identifier(column), tbl=sql.Identifier(table)
+        )
+    )
+    return bool(cur.fetchone()[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommend indexes from the generated-query log.")
+    parser.add_argument(
+        "--query_log",
+        default=os.environ.get("QUERY_LOG_PATH", os.path.join(os.environ.get("LOG_DIR", "./logs"), "generated_queries.jsonl")),
+        help="JSONL query log or plain log file",
+    )
+    parser.add_argument("--min_count", type=int, default=2, help="Minimum uses before a column is indexed")
+    parser.add_argument("--apply", action="store_true", help="Create the recommended indexes and types")
+    parser.add_argument("--measure", action="store_true", help="Time the logged workload before and after")
+    args = parser.parse_args()
+
+    queries = load_query_log(args.query_log)
+    usage = Counter()
+    for query in queries:
+        usage.update(extract_column_usage(query))
+    logger.info(f"Loaded {len(queries)} queries referencing {len(usage)} column usages")
+
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        port=os.getenv("DB_PORT", 5432),
+    )
+    recommendations = recommend_indexes(conn, usage, min_count=args.min_count)
+    for recommendation in recommendations:
+        print(f"-- {recommendation['table']}.{recommendation['column']} used {recommendation['uses']} times")
+        print(f"{recommendation['ddl']};")
+
+    if args.apply and recommendations:
+        before = measure_workload(conn, queries) if args.measure else None
+        apply_recommendations(conn, recommendations)
+        if args.measure:
+            after = measure_workload(conn, queries)
+            print(f"Workload latency: {before['total']:.3f}s before, {after['total']:.3f}s after")
+    elif args.measure:
+        print(f"Workload latency: {measure_workload(conn, queries)['total']:.3f}s")
+    conn.close()
@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+
+# Maps a stable index name (alias) to the versioned Pinecone index serving it.
+INDEX_ALIAS_FILE = os.environ.get("INDEX_ALIAS_FILE", "data/index_aliases.json")
+
+_cache = {"mtime": None, "aliases": {}}
+
+
+def load_aliases(alias_file: str = INDEX_ALIAS_FILE) -> dict:
+    """
+    Return {alias: {"current": version, "history": [older versions, newest first]}}.
+    The file is re-read only when it changes, so resolving on every query is cheap.
+    """
+    try:
+        mtime = os.stat(alias_file).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if _cache["mtime"] != (alias_file, mtime):
+        with open(alias_file, "r") as f:
+            _cache["aliases"] = json.load(f)
+        _cache["mtime"] = (alias_file, mtime)
+    return _cache["aliases"]
+
+
+def resolve_index_name(name: str, alias_file: str = INDEX_ALIAS_FILE) -> str:
+    """Versioned index an alias points to; names that are not aliases are returned unchanged."""
+    alias = load_aliases(alias_file).get(name)
+    return alias["current"] if alias else name
+
+
+def live_index_names(alias_file: str = INDEX_ALIAS_FILE) -> set[str]:
+    """Aliases and the versions they currently serve."""
+    aliases = load_aliases(alias_file)
+    return set(aliases) | {alias["current"] for alias in aliases.values()}
+
+
+def swap_alias(alias: str, version: str, alias_file: str = INDEX_ALIAS_FILE) -> str | None:
+    """
+    Point `alias` at `version` and return the version it replaced.
+    The file is replaced atomically, so readers see either the old or the new mapping.
+    """
+    aliases = dict(load_aliases(alias_file))
+    entry = aliases.get(alias, {"current": None, "history": []})
+    previous = entry["current"]
+    history = ([previous] if previous else []) + [v for v in entry["history"] if v != version]
+    aliases[alias] = {"current": version, "history": history, "swapped_at": datetime.now().isoformat(timespec="seconds")}
+    _write_aliases(aliases, alias_file)
+    return previous
+
+
+def drop_versions(alias: str, versions: list[str], alias_file: str = INDEX_ALIAS_FILE):
+    """Forget garbage-collected versions from an alias' history."""
+    aliases = dict(load_aliases(alias_file))
+    entry = dict(aliases[alias])
+    entry["history"] = [v for v in entry["history"] if v not in versions]
+    aliases[alias] = entry
+    _write_aliases(aliases, alias_file)
+
+
+def new_version_name(alias: str) -> str:
+    # Pinecone index names allow lowercase letters, digits and hyphens.
+    return f"{alias}-v{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+
+def _write_aliases(aliases: dict, alias_file: str):
+    directory = os.path.dirname(alias_file) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".index_aliases")
+    with os.fdopen(fd, "w") as f:
+        json.dump(aliases, f, indent=2)
+    os.replace(tmp_path, alias_file)
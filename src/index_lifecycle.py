@@ -0,0 +1,157 @@
+import argparse
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from llama_index.core import Document
+from pinecone import Pinecone
+from create_vector_database import CricketSchemaParser, create_cricket_database
+from index_aliases import drop_versions, load_aliases, new_version_name, swap_alias
+from query_vector_database import query_database
+from utils import setup_logger
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+
+def build_index_version(
+    alias: str,
+    file_path: str,
+    model: str,
+    embed_batch_size: int,
+    pinecone_config: dict,
+    timeout: float = 300,
+) -> str:
+    """
+    Create a new versioned index for `alias` and wait until all schema vectors are queryable.
+    A version that fails to build is deleted; it is not in the alias history yet,
+    so `garbage_collect` would never find it.
+    """
+    version = new_version_name(alias)
+    logger.info(f"Building index {version} for alias {alias}")
+    try:
+        create_cricket_database(
+            file_path, "pinecone", model, embed_batch_size, pinecone_config, index_name=version
+        )
+
+        with open(file_path, "r") as f:
+            expected = len(CricketSchemaParser()([Document(text=f.read())]))
+        pc_index = Pinecone(api_key=os.environ.get("PINECONE_API_KEY")).Index(name=version)
+        # Upserts to serverless indexes become visible asynchronously.
+        deadline = time.monotonic() + timeout
+        while pc_index.describe_index_stats().total_vector_count < expected:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Index {version} did not reach {expected} vectors within {timeout}s")
+            time.sleep(2)
+    except BaseException:
+        delete_version(version)
+        raise
+    return version
+
+
+def validate_index_version(version: str, sample_queries: list[tuple[str, str]], embed_model: str, top_k: int = 3) -> list[str]:
+    """
+    Run sample queries against a version before it goes live.
+    `sample_queries` are (query, expected table title or None) pairs; returns failure messages.
+    """
+    failures = []
+    for query, expected_title in sample_queries:
+        nodes = query_database(query=query, embed_model=embed_model, index_name=version, top_k=top_k)
+        titles = [node.metadata.get("title") for node in nodes]
+        if not nodes:
+            failures.append(f"No results for '{query}'")
+        elif expected_title and expected_title not in titles:
+            failures.append(f"Expected table '{expected_title}' for '{query}', got {titles}")
+    return failures
+
+
+def delete_version(version: str):
+    """Delete a version that never went live, if it was created at all."""
+    try:
+        pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))
+        if version in pc.list_indexes().names():
+            pc.delete_index(version)
+            logger.info(f"Deleted unused index version {version}")
+    except Exception as e:
+        logger.error(f"Could not delete index version {version}; delete it manually: {e}")
+
+
+def garbage_collect(alias: str, keep: int = 1) -> list[str]:
+    """Delete all but the `keep` most recent previous versions of `alias`; the live version is never touched."""
+    entry = load_aliases().get(alias)
+    if not entry:
+        return []
+    stale = entry["history"][keep:]
+    pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))
+    existing = pc.list_indexes().names()
+    for version in stale:
+        if version in existing:
+            pc.delete_index(version)
+            logger.info(f"Deleted old index version {version}")
+    drop_versions(alias, stale)
+    return stale
+
+
+def rebuild(
+    alias: str,
+    file_path: str,
+    sample_queries: list[tuple[str, str]],
+    model: str = "text-embedding-3-small",
+    embed_batch_size: int = 10,
+    pinecone_config: dict = None,
+    keep: int = 1,
+) -> str:
+    """
+    Blue/green re-index: build a new version, validate it, switch the alias, then
+    garbage-collect old versions. Queries keep hitting the old version until the
+    switch; a version that fails validation is deleted and the alias is left alone.
+    """
+    version = build_index_version(alias, file_path, model, embed_batch_size, pinecone_config)
+    try:
+        failures = validate_index_version(version, sample_queries, model)
+    except BaseException:
+        delete_version(version)
+        raise
+    if failures:
+        delete_version(version)
+        logger.error(f"Index {version} failed validation and was deleted: {failures}")
+        raise ValueError(f"Index {version} failed validation: {failures}")
+
+    previous = swap_alias(alias, version)
+    logger.info(f"Alias {alias} now serves {version} (was {previous})")
+    garbage_collect(alias, keep=keep)
+    return version
+
+
+def rebuild_in_background(*args, **kwargs) -> threading.Thread:
+    """Run `rebuild` on a daemon thread so a long-running process can keep serving queries."""
+    thread = threading.Thread(target=rebuild, args=args, kwargs=kwargs, daemon=True, name="index-rebuild")
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Blue/green rebuild of a cricket schema index.")
+    parser.add_argument("--alias", default="cricket-index", help="Stable name queried by query_database")
+    parser.add_argument("--schema_file", required=True, help="Cricket schema DDL file")
+    parser.add_argument(
+        "--sample_query",
+        action="append",
+        default=[],
+        help="'query' or 'query=>expected_table'; may be repeated",
+    )
+    parser.add_argument("--keep", type=int, default=1, help="Previous versions to keep for rollback")
+    args = parser.parse_args()
+
+    sample_queries = [
+        tuple(part.strip() for part in q.split("=>", 1)) if "=>" in q else (q, None)
+        for q in args.sample_query
+    ] or [("Who scored the most runs in match 12?", None)]
+    pinecone_config = {
+        "metric": "cosine",
+        "dimension": 1536,
+        "cloud": os.environ.get("PINECONE_CLOUD", "aws"),
+        "region": os.environ.get("PINECONE_REGION", "us-west-2"),
+    }
+    rebuild(args.alias, args.schema_file, sample_queries, pinecone_config=pinecone_config, keep=args.keep)
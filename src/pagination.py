@@ -0,0 +1,138 @@
+import pyarrow as pa
+from psycopg2 import sql
+
+# Filter operators exposed to users; anything else is rejected.
+FILTER_OPERATORS = {
+    "=": "=",
+    "!=": "<>",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+}
+
+
+def get_columns(conn, query: str) -> list[str]:
+    """Column names of a query's result without running it (LIMIT 0)."""
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT * FROM ({}) AS q LIMIT 0").format(sql.SQL(query)))
+        return [desc[0] for desc in cur.description]
+
+
+def count_rows(conn, query: str, filters: list[tuple] = None) -> int:
+    """Total rows of a query after filters, computed by the database."""
+    where, params = _where_clause(filters)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT count(*) FROM ({}) AS q{}").format(_subquery(query), where), params)
+        return cur.fetchone()[0]
+
+
+def fetch_page(
+    conn,
+    query: str,
+    page_size: int,
+    offset: int = 0,
+    sort_column: str = None,
+    descending: bool = False,
+    filters: list[tuple] = None,
+    keyset: tuple = None,
+) -> tuple[pa.Table, tuple | None]:
+    """
+    Fetch one page of a query's result as an Arrow table; sorting and filtering run in SQL.
+
+    Parameters:
+    ----
+    - offset (int): Rows to skip; used when no keyset is available.
+    - sort_column (str, optional): Column to order by. Every other column is used
+      as a tie-breaker (by position) so pages are stable between requests.
+    - filters (list, optional): (column, operator, value) tuples; operators are the
+      keys of FILTER_OPERATORS plus "contains" (case-insensitive substring).
+    - keyset (tuple, optional): (last_value, rows_with_last_value) returned for the
+      previous page. Seeks past it on the sort column instead of scanning `offset` rows.
+
+    Returns:
+    ----
+    - (page, keyset): the keyset to pass when fetching the following page, or None.
+      A keyset is only returned for pages in a keyset chain starting at offset 0:
+      a page reached by OFFSET does not know how many rows before it share its
+      last sort value, so the page after it must use OFFSET too.
+    """
+    conditions, params = _conditions(filters)
+    skip = offset
+    chained = offset == 0
+    if sort_column and keyset is not None and keyset[0] is not None:
+        chained = True
+        last_value, ties = keyset
+        operator = "<=" if descending else ">="
+        # NULLS LAST: rows with a NULL sort value always follow the boundary
+        conditions.append(
+            sql.SQL("({col} " + operator + " %s OR {col} IS NULL)").format(col=sql.Identifier(sort_column))
+        )
+        params.append(last_value)
+        # rows equal to last_value that were already shown
+        skip = ties
+
+    where = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    columns = get_columns(conn, query)
+    order_by = [sql.SQL(str(position)) for position in range(1, len(columns) + 1)]
+    if sort_column:
+        direction = sql.SQL(" DESC NULLS LAST" if descending else " ASC NULLS LAST")
+        order_by.insert(0, sql.Identifier(sort_column) + direction)
+
+    statement = sql.SQL("SELECT * FROM ({}) AS q{} ORDER BY {} LIMIT %s OFFSET %s").format(
+        _subquery(query), where, sql.SQL(", ").join(order_by)
+    )
+    with conn.cursor() as cur:
+        cur.execute(statement, params + [page_size, skip])
+        rows = cur.fetchall()
+        names = [desc[0] for desc in cur.description]
+
+    page = pa.table({name: pa.array(values) for name, values in zip(names, _transpose(rows, len(names)))})
+    return page, _next_keyset(page, sort_column, keyset) if chained else None
+
+
+def _subquery(query: str) -> sql.SQL:
+    # The generated SQL is embedded in a statement that takes parameters, so
+    # literal % signs (e.g. LIKE '%Kohli%') must be escaped.
+    return sql.SQL(query.replace("%", "%%"))
+
+
+def _transpose(rows: list[tuple], n_columns: int) -> list[list]:
+    if not rows:
+        return [[] for _ in range(n_columns)]
+    return [list(column) for column in zip(*rows)]
+
+
+def _next_keyset(page: pa.Table, sort_column: str, keyset: tuple) -> tuple | None:
+    if not sort_column or page.num_rows == 0:
+        return None
+    values = page.column(sort_column).to_pylist()
+    last_value = values[-1]
+    if last_value is None:
+        return None
+    ties = sum(1 for value in values if value == last_value)
+    if keyset is not None and keyset[0] == last_value:
+        # the whole page shared the previous boundary value
+        ties += keyset[1]
+    return last_value, ties
+
+
+def _conditions(filters: list[tuple]) -> tuple[list, list]:
+    conditions, params = [], []
+    for column, operator, value in filters or []:
+        if operator == "contains":
+            conditions.append(sql.SQL("CAST({} AS TEXT) ILIKE %s").format(sql.Identifier(column)))
+            params.append(f"%{value}%")
+        elif operator in FILTER_OPERATORS:
+            conditions.append(sql.SQL("{} " + FILTER_OPERATORS[operator] + " %s").format(sql.Identifier(column)))
+            params.append(value)
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+    return conditions, params
+
+
+def _where_clause(filters: list[tuple]):
+    conditions, params = _conditions(filters)
+    if not conditions:
+        return sql.SQL(""), params
+    return sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions), params
@@ -1,15 +1,71 @@
-from openai import OpenAI
-import anthropic
-import pandas as pd
-import psycopg2
 import re
 import os
-from query_vector_database import query_database
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
+from typing import TYPE_CHECKING
+from sql_validation import parse_schema_columns, validate_sql
+from rate_limiter import scheduler, BATCH
+from utils import setup_logger
+
+# Provider SDKs, pandas/psycopg2 and the vector store stack are imported where
+# they are used so only the selected provider is ever loaded.
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = setup_logger(__name__)
+
+# Seconds to wait for any raced model before giving up on the race.
+RACE_TIMEOUT = float(os.environ.get("LLM_RACE_TIMEOUT", 30))
+# Number of generate -> validate rounds before giving up on a prompt.
+MAX_REPAIR_ATTEMPTS = int(os.environ.get("SQL_MAX_REPAIR_ATTEMPTS", 3))
+
+# Rate-limit budgets are tracked per provider and model.
+PROVIDERS = {"gpt": "openai", "claude": "anthropic"}
+
+# USD per million (prompt, generated) tokens, matched by longest model-name prefix.
+# Override or extend with LLM_PRICES='{"model": [prompt, generated]}'.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-opus": (15.00, 75.00),
+    "claude-3-sonnet": (3.00, 15.00),
+    "claude-3-haiku": (0.25, 1.25),
+}
+MODEL_PRICES.update({model: tuple(price) for model, price in json.loads(os.environ.get("LLM_PRICES", "{}")).items()})
+
+
+@lru_cache(maxsize=None)
+def get_openai_client(api_key: str, timeout: float = None):
+    """Shared OpenAI client per key/timeout so HTTP connections stay warm across handlers."""
+    from openai import OpenAI
+
+    if timeout is None:
+        return OpenAI(api_key=api_key)
+    # Hedged calls should fail fast rather than retry behind our back.
+    return OpenAI(api_key=api_key, timeout=timeout, max_retries=0)
+
+
+@lru_cache(maxsize=None)
+def get_anthropic_client(api_key: str, timeout: float = None):
+    """Shared Anthropic client per key/timeout, see `get_openai_client`."""
+    import anthropic
+
+    if timeout is None:
+        return anthropic.Anthropic(api_key=api_key)
+    return anthropic.Anthropic(api_key=api_key, timeout=timeout, max_retries=0)
 
 
 class LLMQueryHandler:
     """
     A handler for querying Pinecone vector DB + PostgreSQL using LLM-generated SQL.
+
+    With `backend="duckdb"` queries run on embedded DuckDB over the Parquet files
+    written by `create_parquet_from_csv`; `db_params` is then {"parquet_dir": ...}.
     """
 
     def __init__(
@@ -20,28 +76,50 @@ class LLMQueryHandler:
         db_params: dict,
         index_name: str = None,
         top_k=5,
+        example_store=None,
+        n_examples: int = 3,
+        connection_pool=None,
+        priority: int = BATCH,
+        backend: str = "postgres",
     ):
+        if backend not in ("postgres", "duckdb"):
+            raise ValueError(f"Unsupported backend: {backend}")
         self.model = model
         self.vector_store = vector_store  # should be "pinecone"
         self.embed_model = embed_model
         self.db_params = db_params  # dict: {user, password, host, port, dbname}
+        self.connection_pool = connection_pool  # optional psycopg2 pool shared across handlers
+        self.priority = priority  # rate_limiter.INTERACTIVE or rate_limiter.BATCH
+        self.backend = backend  # "postgres" or "duckdb"
         self.index_name = index_name
         self.top_k = top_k
+        self.example_store = example_store  # optional example_store.ExampleStore
+        self.n_examples = n_examples
         self.messages = []
+        self.schema_columns = {}
+        self.last_guard = None
 
     def get_semantic_schemas(self, user_prompt: str) -> list[str]:
+        from query_vector_database import query_database
+
         nodes = query_database(
             query=user_prompt,
             vector_store=self.vector_store,
             embed_model=self.embed_model,
             index_name=self.index_name,
             top_k=self.top_k,
+            priority=self.priority,
         )
         return [node.get_text() for node in nodes]
 
     def generate_initial_query(self, schemas: list[str], user_prompt: str, context: str, system_prompt: str = None):
         if system_prompt is None:
-            system_prompt = self._create_system_prompt(schemas, context)
+            examples = []
+            if self.example_store is not None:
+                examples = self.example_store.search(user_prompt, top_k=self.n_examples, priority=self.priority)
+            system_prompt = self._create_system_prompt(schemas, context, examples)
+        self.system_prompt = system_prompt
+        self.schema_columns = parse_schema_columns(schemas)
 
         model_service = self._find_model()
         if model_service == "gpt":
@@ -51,38 +129,209 @@ class LLMQueryHandler:
             self.messages.append({"role": "user", "content": user_prompt})
 
     def generate_sql_query(self) -> dict:
-        if self._find_model() == "gpt":
+        return self._call_model(self.model)
+
+    def generate_validated_sql_query(
+        self,
+        max_attempts: int = MAX_REPAIR_ATTEMPTS,
+        explain: bool = False,
+        race_models: list[str] = None,
+        fallback_models: list[str] = None,
+    ) -> dict:
+        """
+        Generate SQL and validate it locally before it reaches the database.
+
+        Validation strips markdown fences, parses the query, checks tables and
+        columns against the retrieved schemas and rejects anything that is not
+        read-only; with `explain=True` PostgreSQL also plans the query. Errors are
+        fed back to the model through `self.messages` for up to `max_attempts`
+        rounds. Token counts in the result cover every attempt.
+        """
+        n_prompt_tokens = 0
+        n_generated_tokens = 0
+        for attempt in range(1, max_attempts + 1):
+            if race_models:
+                # An invalid candidate comes back so its errors go through the repair loop below.
+                output = self.race_sql_query(race_models, fallback_models=fallback_models, allow_invalid=True)
+            else:
+                output = self.generate_sql_query()
+            n_prompt_tokens += output["N_PROMPT_TOKENS"]
+            n_generated_tokens += output["N_GENERATED_TOKENS"]
+
+            sql_query, errors = self.validate_sql_query(output["SQL_QUERY"], explain=explain)
+            if not errors:
+                output.update(
+                    SQL_QUERY=sql_query,
+                    N_PROMPT_TOKENS=n_prompt_tokens,
+                    N_GENERATED_TOKENS=n_generated_tokens,
+                    ATTEMPTS=attempt,
+                )
+                return output
+
+            logger.info(f"Attempt {attempt} produced invalid SQL: {errors}")
+            error_list = "\n".join(f"- {error}" for error in errors)
+            self.messages.append({"role": "assistant", "content": output["SQL_QUERY"]})
+            self.messages.append(
+                {
+                    "role": "user",
+                    "content": f"The SQL query is invalid:\n{error_list}\nReturn only the corrected SQL query.",
+                }
+            )
+
+        raise ValueError(f"No valid SQL after {max_attempts} attempts: {errors}")
+
+    def validate_sql_query(self, sql_query: str, explain: bool = False) -> tuple[str, list[str]]:
+        """Validate SQL against the schemas from `generate_initial_query`; see `sql_validation.validate_sql`."""
+        if not explain or self.backend == "duckdb":
+            return validate_sql(sql_query, self.schema_columns)
+        conn = self._connect()
+        try:
+            return validate_sql(sql_query, self.schema_columns, conn=conn)
+        finally:
+            self._release(conn)
+
+    def race_sql_query(
+        self,
+        models: list[str],
+        fallback_models: list[str] = None,
+        timeout: float = RACE_TIMEOUT,
+        validate=None,
+        allow_invalid: bool = False,
+    ) -> dict:
+        """
+        Send the current messages to several models at once and return the first
+        response that passes validation. Remaining requests are abandoned.
+
+        If no raced model produces valid SQL within `timeout` (slow provider,
+        rate limit, bad output), `fallback_models` are tried one after another.
+        The returned dict has the usual keys plus "RACE" describing the winner
+        and why the other models lost. With `allow_invalid=True` the first
+        response that failed validation is returned instead of raising when
+        no model produced valid SQL.
+        """
+        if validate is None:
+            validate = lambda sql_query: not self.validate_sql_query(sql_query)[1]
+
+        start = time.perf_counter()
+        failures = {}
+        executor = ThreadPoolExecutor(max_workers=len(models))
+        futures = {
+            executor.submit(self._call_model, model, timeout): model for model in models
+        }
+        winner = None
+        first_invalid = None
+        pending = set(futures)
+        deadline = start + timeout
+        try:
+            while pending and winner is None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    model = futures[future]
+                    try:
+                        output = future.result()
+                    except Exception as e:
+                        failures[model] = f"{type(e).__name__}: {e}"
+                        continue
+                    if validate(output["SQL_QUERY"]):
+                        winner = output
+                        break
+                    failures[model] = "invalid SQL"
+                    first_invalid = first_invalid or output
+        finally:
+            # Running HTTP calls cannot be interrupted; they are bounded by the
+            # client timeout and their results are discarded.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for future in pending:
+            failures.setdefault(futures[future], "timed out")
+
+        if winner is None:
+            for model in fallback_models or []:
+                try:
+                    output = self._call_model(model, timeout)
+                except Exception as e:
+                    failures[model] = f"{type(e).__name__}: {e}"
+                    continue
+                if validate(output["SQL_QUERY"]):
+                    winner = output
+                    break
+                failures[model] = "invalid SQL"
+                first_invalid = first_invalid or output
+
+        if winner is None and allow_invalid and first_invalid is not None:
+            winner = first_invalid
+        if winner is None:
+            logger.error(f"No model returned valid SQL: {failures}")
+            raise RuntimeError(f"No model returned valid SQL: {failures}")
+
+        winner["RACE"] = {
+            "WINNER": winner["MODEL"],
+            "FAILURES": failures,
+            "LATENCY_S": round(time.perf_counter() - start, 3),
+        }
+        logger.info(f"Model race won by {winner['MODEL']} in {winner['RACE']['LATENCY_S']}s, failures: {failures}")
+        return winner
+
+    def _call_model(self, model: str, timeout: float = None) -> dict:
+        """Send the current messages to `model` through the rate-limit scheduler."""
+        model_service = self._find_model(model)
+        messages = self._messages_for(model_service)
+        # ~4 characters per token for the prompt, plus room for the reply. GPT
+        # messages already contain the system prompt; Claude receives it separately.
+        prompt_chars = sum(len(m["content"]) for m in messages)
+        if model_service != "gpt":
+            prompt_chars += len(self.system_prompt)
+        estimated_tokens = prompt_chars // 4 + 500
+        return scheduler.submit(
+            PROVIDERS.get(model_service, model_service),
+            model,
+            self._request_model,
+            model,
+            timeout,
+            estimated_tokens=estimated_tokens,
+            priority=self.priority,
+            usage=lambda output: output["N_PROMPT_TOKENS"] + output["N_GENERATED_TOKENS"],
+            # Raced calls fail over to another model instead of waiting out a 429.
+            max_retries=0 if timeout is not None else None,
+        )
+
+    def _request_model(self, model: str, timeout: float = None) -> dict:
+        """Send the current messages to `model` and return the SQL with token usage."""
+        model_service = self._find_model(model)
+        if model_service == "gpt":
             openai_api_key = os.environ.get("OPENAI_API_KEY")
             if openai_api_key is None:
                 raise ValueError("OPENAI_API_KEY must be set.")
 
-            self.client = OpenAI(api_key=openai_api_key)
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
+            client = get_openai_client(openai_api_key, timeout)
+            completion = client.chat.completions.create(
+                model=model,
+                messages=self._messages_for(model_service),
             )
             sql_query = completion.choices[0].message.content
             n_generated_tokens = completion.usage.completion_tokens
             n_prompt_tokens = completion.usage.prompt_tokens
-            model = completion.model
             return {
                 "SQL_QUERY": sql_query,
-                "MODEL": model,
+                "MODEL": completion.model,
                 "N_PROMPT_TOKENS": n_prompt_tokens,
                 "N_GENERATED_TOKENS": n_generated_tokens,
             }
 
-        elif self._find_model() == "claude":
+        elif model_service == "claude":
             claude_api_key = os.environ.get("CLAUDE_API_KEY")
             if claude_api_key is None:
                 raise ValueError("CLAUDE_API_KEY must be set.")
 
-            client = anthropic.Anthropic(api_key=claude_api_key)
+            client = get_anthropic_client(claude_api_key, timeout)
             message = client.messages.create(
-                model=self.model,
+                model=model,
                 max_tokens=1000,
                 system=self.system_prompt,
-                messages=self.messages,
+                messages=self._messages_for(model_service),
             )
             sql_query = message.content[0].text
             return {
@@ -92,9 +341,55 @@ class LLMQueryHandler:
                 "N_GENERATED_TOKENS": message.usage.output_tokens,
             }
 
-    def execute_sql_on_db(self, query: str, params=None) -> tuple[pd.DataFrame | None, None | str]:
-        """Executes SQL query on PostgreSQL and returns DataFrame."""
+        raise ValueError(f"Unsupported model: {model}")
+
+    def _messages_for(self, model_service: str) -> list[dict]:
+        """Adapt the stored messages to the provider: Claude takes the system prompt separately."""
+        messages = [m for m in self.messages if m["role"] != "system"]
+        if model_service == "gpt":
+            return [{"role": "system", "content": self.system_prompt}] + messages
+        return messages
+
+    def execute_sql_on_db(self, query: str, params=None, guard: bool = False) -> tuple["pd.DataFrame | None", None | str]:
+        """
+        Executes SQL query on PostgreSQL and returns DataFrame.
+        With `guard=True` the plan is checked by `cost_guard.guard_query` first;
+        the guard result (including any rewritten SQL) is kept in `self.last_guard`.
+        The guard uses PostgreSQL plan estimates and is skipped on the DuckDB backend.
+        """
+        if self.backend == "duckdb":
+            from duckdb_backend import execute_sql
+
+            try:
+                return execute_sql(self.db_params["parquet_dir"], query, params), None
+            except Exception as e:
+                return None, str(e)
+
+        import pandas as pd
+        from cost_guard import guard_query
+
         try:
+            conn = self._connect()
+            try:
+                if guard:
+                    self.last_guard = guard_query(conn, query)
+                    if self.last_guard["ACTION"] == "rejected":
+                        return None, self.last_guard["REASON"]
+                    query = self.last_guard["SQL_QUERY"]
+                df = pd.read_sql_query(query, conn, params=params)
+            finally:
+                self._release(conn)
+            return df, None
+        except Exception as e:
+            return None, str(e)
+
+    def _connect(self):
+        """Connection for generated SQL; sessions are read-only so the parser is not the only safeguard."""
+        if self.connection_pool is not None:
+            conn = self.connection_pool.getconn()
+        else:
+            import psycopg2
+
             conn = psycopg2.connect(
                 dbname=self.db_params["dbname"],
                 user=self.db_params["user"],
@@ -102,14 +397,34 @@ class LLMQueryHandler:
                 host=self.db_params["host"],
                 port=self.db_params["port"],
             )
-            df = pd.read_sql_query(query, conn, params=params)
+        conn.set_session(readonly=True)
+        return conn
+
+    def _release(self, conn):
+        if self.connection_pool is not None:
+            broken = False
+            try:
+                conn.rollback()
+            except Exception as e:
+                logger.warning(f"Discarding pooled connection after failed rollback: {e}")
+                broken = True
+            # Always hand the slot back, closing connections that are no longer usable.
+            self.connection_pool.putconn(conn, close=broken)
+        else:
             conn.close()
-            return df, None
-        except Exception as e:
-            return None, str(e)
 
-    def _find_model(self):
-        match = re.search(r"(gpt|claude)", self.model)
+    @staticmethod
+    def calculate_query_execution_cost(model: str, n_prompt_tokens: int, n_generated_tokens: int) -> float:
+        """Cost in USD of one generation, from MODEL_PRICES."""
+        matches = [name for name in MODEL_PRICES if model.startswith(name)]
+        if not matches:
+            logger.warning(f"No price configured for model {model}; counting cost as 0")
+            return 0.0
+        prompt_price, generated_price = MODEL_PRICES[max(matches, key=len)]
+        return (n_prompt_tokens * prompt_price + n_generated_tokens * generated_price) / 1_000_000
+
+    def _find_model(self, model: str = None):
+        match = re.search(r"(gpt|claude)", model or self.model)
         return match.group() if match else None
 
     def _find_claude_model(self):
@@ -118,15 +433,22 @@ class LLMQueryHandler:
             return match.group() if match else None
         return None
 
-    def _create_system_prompt(self, schemas: list[str], context: str) -> str:
+    def _create_system_prompt(self, schemas: list[str], context: str, examples: list[dict] = None) -> str:
+        example_text = ""
+        if examples:
+            example_text = "Example questions and their SQL:\n" + "\n\n".join(
+                f"Question: {example['question']}\nSQL: {example['sql']}" for example in examples
+            )
         self.system_prompt = f"""
-        You are an expert SQL assistant for a Cricket Analytics Database (PostgreSQL).
+        You are an expert SQL assistant for a Cricket Analytics Database ({"DuckDB" if self.backend == "duckdb" else "PostgreSQL"}).
 
         SQL Schema:
         {schemas}
 
         {context}
 
+        {example_text}
+
         - Only output valid SQL queries.
         - Do NOT explain, only return SQL.
         """
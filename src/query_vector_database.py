@@ -1,20 +1,9 @@
-from llama_index.vector_stores.pinecone import PineconeVectorStore
-from llama_index.core import VectorStoreIndex
-from llama_index.embeddings.openai import OpenAIEmbedding
-from pinecone import Pinecone
 from dotenv import load_dotenv
+from functools import lru_cache
 import os
-import logging
-
-
-def setup_logger(name: str):
-    """Helper logger setup"""
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    handler = logging.StreamHandler()
-    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-    logger.addHandler(handler)
-    return logger
+from rate_limiter import scheduler, BATCH
+from index_aliases import resolve_index_name
+from utils import setup_logger
 
 
 def query_database(
@@ -23,6 +12,8 @@ def query_database(
     embed_batch_size: int = 10,
     index_name: str = "cricket-index",
     top_k: int = 5,
+    vector_store: str = "pinecone",
+    priority: int = BATCH,
 ):
     """
     Queries the Pinecone vector database for items that are similar to a given query.
@@ -32,14 +23,23 @@ def query_database(
     - query (str): The query string to search for.
     - embed_model (str): OpenAI embedding model name (e.g. "text-embedding-3-small").
     - embed_batch_size (int, optional): The number of docs to process per batch. Default=10.
-    - index_name (str, optional): The Pinecone index to query. Default="cricket-index".
+    - index_name (str, optional): The Pinecone index or alias to query. Default="cricket-index".
     - top_k (int, optional): Number of top similar items to retrieve. Default=5.
+    - vector_store (str, optional): Vector store backend; only "pinecone" is supported.
+    - priority (int, optional): Scheduling priority of the query embedding call. Default=BATCH.
 
     Returns:
     ----
     - A list of nodes representing the top k similar items.
     """
 
+    if vector_store != "pinecone":
+        raise ValueError(f"{vector_store} is not supported for querying. Currently supported: 'pinecone'")
+    if index_name is None:
+        index_name = "cricket-index"
+    # Aliases are switched by index_lifecycle when a rebuilt index goes live.
+    index_name = resolve_index_name(index_name)
+
     load_dotenv()
 
     pinecone_api_key = os.getenv("PINECONE_API_KEY")
@@ -50,6 +50,34 @@ def query_database(
     if not openai_api_key:
         raise ValueError("OPENAI_API_KEY must be specified in .env file.")
 
+    retriever = get_retriever(
+        index_name, embed_model, embed_batch_size, top_k, pinecone_api_key, openai_api_key
+    )
+    # The query embedding is the rate-limited part of retrieval.
+    nodes = scheduler.submit(
+        "openai", embed_model, retriever.retrieve, query,
+        estimated_tokens=len(query) // 4 + 1, priority=priority,
+    )
+
+    return nodes
+
+
+@lru_cache(maxsize=32)
+def get_retriever(
+    index_name: str,
+    embed_model: str,
+    embed_batch_size: int,
+    top_k: int,
+    pinecone_api_key: str,
+    openai_api_key: str,
+):
+    """Build (once per configuration) a retriever over a Pinecone index; clients stay warm between queries."""
+    # Imported here so callers only load the vector store stack they use.
+    from llama_index.vector_stores.pinecone import PineconeVectorStore
+    from llama_index.core import VectorStoreIndex
+    from llama_index.embeddings.openai import OpenAIEmbedding
+    from pinecone import Pinecone
+
     # Connect to Pinecone
     pc = Pinecone(api_key=pinecone_api_key)
 
@@ -59,20 +87,16 @@ def query_database(
     pc_index = pc.Index(name=index_name)
 
     # Wrap Pinecone index
-    vector_store = PineconeVectorStore(pinecone_index=pc_index, api_key=pinecone_api_key)
+    pinecone_store = PineconeVectorStore(pinecone_index=pc_index, api_key=pinecone_api_key)
 
     # Setup retriever
-    retriever = VectorStoreIndex.from_vector_store(
-        vector_store=vector_store,
+    return VectorStoreIndex.from_vector_store(
+        vector_store=pinecone_store,
         embed_model=OpenAIEmbedding(
             model=embed_model, embed_batch_size=embed_batch_size, api_key=openai_api_key
         ),
     ).as_retriever(similarity_top_k=top_k)
 
-    nodes = retriever.retrieve(query)
-
-    return nodes
-
 
 if __name__ == "__main__":
     logger = setup_logger(__name__)
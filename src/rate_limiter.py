@@ -0,0 +1,236 @@
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from utils import setup_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: budgets fall back to per process
+    fcntl = None
+
+logger = setup_logger(__name__)
+
+# Lower value is served first.
+INTERACTIVE = 0
+BATCH = 10
+
+# Per "provider:model" budgets, e.g. {"openai:gpt-4o-mini": {"rpm": 500, "tpm": 200000}}.
+RATE_LIMITS = json.loads(os.environ.get("LLM_RATE_LIMITS", "{}"))
+DEFAULT_RPM = int(os.environ.get("LLM_DEFAULT_RPM", 500))
+DEFAULT_TPM = int(os.environ.get("LLM_DEFAULT_TPM", 200_000))
+MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 5))
+BASE_BACKOFF = float(os.environ.get("LLM_BASE_BACKOFF", 1.0))
+MAX_BACKOFF = float(os.environ.get("LLM_MAX_BACKOFF", 60.0))
+# Budget state shared by every process on the host (CLI cron jobs, Streamlit,
+# service.py). Set to an empty string to keep budgets per process.
+RATE_STATE_FILE = os.environ.get(
+    "LLM_RATE_STATE_FILE", os.path.join(tempfile.gettempdir(), "text_sql_llm_rate_state.json")
+)
+
+WINDOW_SECONDS = 60.0
+# How often a waiting call re-checks the shared state.
+POLL_SECONDS = 0.1
+# A waiting call that has not re-checked for this long belongs to a dead process.
+WAITER_TTL_SECONDS = 10.0
+
+
+class _Budget:
+    """
+    Sliding one-minute window of requests and tokens for one provider/model.
+    Times are wall-clock seconds so windows can be compared across processes.
+    """
+
+    def __init__(self, rpm: int, tpm: int, state: dict = None):
+        state = state or {}
+        self.rpm = rpm
+        self.tpm = tpm
+        self.events = state.get("events", [])  # [timestamp, tokens, event id]
+        self.backoff = state.get("backoff", 0.0)
+        self.blocked_until = state.get("blocked_until", 0.0)
+
+    @property
+    def tokens(self) -> int:
+        return sum(event[1] for event in self.events)
+
+    def to_state(self) -> dict:
+        return {"events": self.events, "backoff": self.backoff, "blocked_until": self.blocked_until}
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        self.events = [event for event in self.events if event[0] > now - WINDOW_SECONDS]
+        waits = [self.blocked_until - now]
+        if len(self.events) >= self.rpm:
+            waits.append(self.events[0][0] + WINDOW_SECONDS - now)
+        # A single request larger than the whole budget is let through on an empty window.
+        if self.events and self.tokens + tokens > self.tpm:
+            waits.append(self.events[0][0] + WINDOW_SECONDS - now)
+        return max(0.0, *waits)
+
+    def reserve(self, tokens: int, now: float, event_id: str) -> str:
+        self.events.append([now, tokens, event_id])
+        return event_id
+
+    def settle(self, event_id: str, actual_tokens: int):
+        """Replace a reservation's estimate with the usage the provider reported."""
+        for event in self.events:
+            if event[2] == event_id:
+                event[1] = actual_tokens
+
+
+class _LocalState:
+    """Budget state for this process only."""
+
+    def __init__(self):
+        self.state = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            yield self.state
+
+
+class _SharedState:
+    """Budget state in a JSON file, read and rewritten under an exclusive flock."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.path, "r") as f:
+                        state = json.load(f)
+                except (FileNotFoundError, json.JSONDecodeError):
+                    state = {}
+                yield state
+                tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class RateLimitScheduler:
+    """
+    Admit provider calls within per-model request/token-per-minute budgets.
+
+    Waiting calls are served by priority (INTERACTIVE before BATCH), then
+    arrival order. Rate-limit errors (HTTP 429) pause the model with an
+    exponential backoff that grows on repeated 429s and decays on success.
+    With a `state_file`, budgets, backoff and the wait queue are shared by all
+    processes using the file, so a CLI cron job and Streamlit draw from one
+    budget and interactive calls overtake batch calls across processes.
+    """
+
+    def __init__(self, limits: dict = None, max_retries: int = MAX_RETRIES, state_file: str = RATE_STATE_FILE):
+        self.limits = limits if limits is not None else RATE_LIMITS
+        self.max_retries = max_retries
+        self.sequence = itertools.count()
+        if state_file and fcntl is not None:
+            self.state = _SharedState(state_file)
+        else:
+            self.state = _LocalState()
+
+    def submit(
+        self,
+        provider: str,
+        model: str,
+        fn,
+        *args,
+        estimated_tokens: int = 0,
+        priority: int = BATCH,
+        usage=None,
+        max_retries: int = None,
+        **kwargs,
+    ):
+        """
+        Run `fn(*args, **kwargs)` once the budget allows and return its result.
+        `usage(result)` should return the tokens actually consumed.
+        """
+        key = f"{provider}:{model}"
+        retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(retries + 1):
+            event_id = self._acquire(key, estimated_tokens, priority)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not _is_rate_limit_error(e) or attempt == retries:
+                    raise
+                delay = self._penalise(key, e)
+                logger.warning(f"Rate limited on {key}, retry {attempt + 1}/{retries} in {delay:.1f}s")
+                continue
+            with self._budget(key) as (budget, _):
+                budget.backoff /= 2
+                if usage is not None:
+                    budget.settle(event_id, usage(result))
+            return result
+
+    @contextmanager
+    def _budget(self, key: str):
+        """Yield the budget and wait queue for `key` and store any changes."""
+        with self.state.locked() as state:
+            entry = state.setdefault(key, {"waiting": []})
+            limit = self.limits.get(key, {})
+            budget = _Budget(limit.get("rpm", DEFAULT_RPM), limit.get("tpm", DEFAULT_TPM), entry)
+            yield budget, entry["waiting"]
+            entry.update(budget.to_state())
+
+    def _acquire(self, key: str, tokens: int, priority: int) -> str:
+        ticket_id = f"{os.getpid()}-{threading.get_ident()}-{next(self.sequence)}"
+        # [priority, arrival, id, expires]
+        with self._budget(key) as (_, waiting):
+            waiting.append([priority, time.time(), ticket_id, time.time() + WAITER_TTL_SECONDS])
+        try:
+            while True:
+                with self._budget(key) as (budget, waiting):
+                    now = time.time()
+                    waiting[:] = [t for t in waiting if t[3] > now or t[2] == ticket_id]
+                    for ticket in waiting:
+                        if ticket[2] == ticket_id:
+                            ticket[3] = now + WAITER_TTL_SECONDS
+                    first = min(waiting, key=lambda t: (t[0], t[1]))
+                    wait = budget.wait_time(tokens, now)
+                    if first[2] == ticket_id and wait == 0:
+                        waiting[:] = [t for t in waiting if t[2] != ticket_id]
+                        return budget.reserve(tokens, now, ticket_id)
+                if first[2] != ticket_id:
+                    wait = POLL_SECONDS
+                # Wake up in time to refresh the ticket before it expires.
+                time.sleep(min(max(wait, POLL_SECONDS), WAITER_TTL_SECONDS / 2))
+        except BaseException:
+            with self._budget(key) as (_, waiting):
+                waiting[:] = [t for t in waiting if t[2] != ticket_id]
+            raise
+
+    def _penalise(self, key: str, error: Exception) -> float:
+        with self._budget(key) as (budget, _):
+            budget.backoff = min(MAX_BACKOFF, max(BASE_BACKOFF, budget.backoff * 2))
+            delay = _retry_after(error) or budget.backoff
+            budget.blocked_until = max(budget.blocked_until, time.time() + delay)
+            return delay
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or "RateLimit" in type(error).__name__
+
+
+def _retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+scheduler = RateLimitScheduler()
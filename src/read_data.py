@@ -1,28 +1,46 @@
-input_queries = []
-output_queries = []
-
-with open(
-    "/Users/melvin/data/data.txt",
-    "r",
-) as f:
-    text = f.read()
-
-lines = text.split("\n")
-
-current_section = None
-
-for line in lines:
-    if line.startswith("input:"):
-        current_section = "input"
-        input_queries.append(line[len("input:") :].strip())
-    elif line.startswith("output:"):
-        current_section = "output"
-        output_queries.append(line[len("output:") :].strip())
-    else:
-        if current_section == "input" and input_queries:
-            input_queries[-1] += " " + line.strip()
-        elif current_section == "output" and output_queries:
-            output_queries[-1] += " " + line.strip()
-
-print(input_queries)
-print(output_queries)
+import os
+
+DATA_FILE = os.environ.get("QUESTION_SQL_FILE", "/Users/melvin/data/data.txt")
+
+
+def iter_query_pairs(file_path: str = DATA_FILE):
+    """
+    Stream (question, sql) pairs from a file of `input:` / `output:` blocks.
+    Continuation lines are appended to the current block; only one pair is held
+    in memory at a time.
+    """
+    current_section = None
+    current_input = None
+    current_output = None
+
+    with open(file_path, "r") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("input:"):
+                if current_input is not None and current_output is not None:
+                    yield current_input, current_output
+                current_section = "input"
+                current_input = line[len("input:") :].strip()
+                current_output = None
+            elif line.startswith("output:"):
+                current_section = "output"
+                current_output = line[len("output:") :].strip()
+            else:
+                if current_section == "input" and current_input is not None:
+                    current_input += " " + line.strip()
+                elif current_section == "output" and current_output is not None:
+                    current_output += " " + line.strip()
+
+    if current_input is not None and current_output is not None:
+        yield current_input, current_output
+
+
+if __name__ == "__main__":
+    input_queries = []
+    output_queries = []
+    for input_query, output_query in iter_query_pairs():
+        input_queries.append(input_query)
+        output_queries.append(output_query)
+
+    print(input_queries)
+    print(output_queries)
@@ -0,0 +1,110 @@
+import re
+import pandas as pd
+
+# String columns with at most this many distinct values become pandas categories
+# (and optionally PostgreSQL enums).
+MAX_CATEGORIES = 1000
+
+# (pandas dtype, PostgreSQL type, min, max) from smallest to largest.
+INTEGER_TYPES = [
+    ("int8", "SMALLINT", -(2**7), 2**7 - 1),
+    ("int16", "SMALLINT", -(2**15), 2**15 - 1),
+    ("int32", "INTEGER", -(2**31), 2**31 - 1),
+    ("int64", "BIGINT", -(2**63), 2**63 - 1),
+]
+
+
+def infer_schema(csv_path: str, chunksize: int = 100_000, max_categories: int = MAX_CATEGORIES) -> dict[str, dict]:
+    """
+    Infer compact column types for a CSV in a single streaming pass.
+
+    Every row is seen, so integer ranges are exact; distinct values are only
+    tracked until a column exceeds `max_categories`.
+
+    Returns:
+    ----
+    - column -> {"pandas": dtype, "postgres": type, "nullable": bool, "categories": list | None}
+    """
+    stats = {}
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=str, keep_default_na=True):
+        for column in chunk.columns:
+            values = chunk[column].dropna()
+            col = stats.setdefault(
+                column, {"numeric": True, "integer": True, "min": None, "max": None, "nulls": False, "distinct": set()}
+            )
+            col["nulls"] |= len(values) < len(chunk)
+            if col["distinct"] is not None:
+                col["distinct"].update(values.unique())
+                if len(col["distinct"]) > max_categories:
+                    col["distinct"] = None
+            if not col["numeric"] or values.empty:
+                continue
+            numbers = pd.to_numeric(values, errors="coerce")
+            if numbers.isna().any():
+                col["numeric"] = False
+                continue
+            col["integer"] &= bool((numbers == numbers.round()).all()) and not values.str.contains(r"[.eE]").any()
+            col["min"] = numbers.min() if col["min"] is None else min(col["min"], numbers.min())
+            col["max"] = numbers.max() if col["max"] is None else max(col["max"], numbers.max())
+
+    return {column: _choose_type(col) for column, col in stats.items()}
+
+
+def pandas_dtypes(schema: dict[str, dict]) -> dict:
+    """
+    dtype mapping for `pd.read_csv` matching an inferred schema. Categories are
+    fixed up front so every chunk of a chunked read shares one dictionary.
+    """
+    return {
+        column: pd.CategoricalDtype(spec["categories"]) if spec["categories"] else spec["pandas"]
+        for column, spec in schema.items()
+    }
+
+
+def to_postgres_ddl(table_name: str, schema: dict[str, dict], use_enums: bool = False) -> str:
+    """
+    Emit CREATE TABLE DDL (preceded by CREATE TYPE statements when `use_enums`).
+    Enums are off by default because LIKE/ILIKE do not work on enum columns.
+    """
+    statements = []
+    columns = []
+    for column, spec in schema.items():
+        pg_type = spec["postgres"]
+        if use_enums and spec["categories"]:
+            pg_type = _quote(f"{table_name}_{column}_enum")
+            labels = ", ".join("'" + label.replace("'", "''") + "'" for label in spec["categories"])
+            statements.append(f"CREATE TYPE {pg_type} AS ENUM ({labels})")
+        null = "" if spec["nullable"] else " NOT NULL"
+        columns.append(f"    {_quote(column)} {pg_type}{null}")
+    statements.append(f"CREATE TABLE {_quote(table_name)} (\n" + ",\n".join(columns) + "\n)")
+    return ";\n".join(statements) + ";"
+
+
+def write_schema_file(ddls: list[str], file_path: str):
+    """Write DDL in the `;`-separated format read by `CricketSchemaParser`."""
+    with open(file_path, "w") as f:
+        f.write("\n\n".join(ddls) + "\n")
+
+
+def _choose_type(col: dict) -> dict:
+    categories = sorted(col["distinct"]) if col["distinct"] else None
+    spec = {"nullable": col["nulls"], "categories": None}
+    if col["numeric"] and col["min"] is not None and col["integer"]:
+        for pandas_type, pg_type, low, high in INTEGER_TYPES:
+            if low <= col["min"] and col["max"] <= high:
+                break
+        # Nullable integers need pandas' extension types (Int8, Int16, ...).
+        spec.update(pandas=pandas_type.capitalize() if col["nulls"] else pandas_type, postgres=pg_type)
+    elif col["numeric"] and col["min"] is not None:
+        spec.update(pandas="float64", postgres="DOUBLE PRECISION")
+    elif categories is not None:
+        spec.update(pandas="category", postgres="TEXT", categories=categories)
+    else:
+        spec.update(pandas="object", postgres="TEXT")
+    return spec
+
+
+def _quote(identifier: str) -> str:
+    if re.fullmatch(r"[a-z_][a-z0-9_]*", identifier):
+        return identifier
+    return '"' + identifier.replace('"', '""') + '"'
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from psycopg2.pool import ThreadedConnectionPool
+from query_llm import LLMQueryHandler
+from sql_validation import validate_sql
+from rate_limiter import INTERACTIVE
+from utils import setup_logger, log_generated_query
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "pinecone")
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "text-embedding-3-small")
+GPT_MODEL = os.environ.get("GPT_MODEL", "gpt-4o-mini")
+CONTEXT_FILE = os.environ.get("CONTEXT_FILE", "data/context.txt")
+EXAMPLE_STORE_DIR = os.environ.get("EXAMPLE_STORE_DIR")
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+
+DB_PARAMS = {
+    "host": os.environ.get("DB_HOST"),
+    "dbname": os.environ.get("DB_NAME"),
+    "user": os.environ.get("DB_USER"),
+    "password": os.environ.get("DB_PASSWORD"),
+    "port": os.environ.get("DB_PORT", 5432),
+}
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one execution.
+    Callers arriving while a call is in flight await its result instead of
+    starting their own; nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._inflight: dict[tuple, asyncio.Future] = {}
+
+    async def do(self, key: tuple, fn, *args, limiter: asyncio.Semaphore = None):
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(fn, args, limiter))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.info(f"Coalesced {key[0]} request")
+        # shield: one caller disconnecting must not cancel the shared call
+        return await asyncio.shield(future)
+
+    @staticmethod
+    async def _run(fn, args: tuple, limiter: asyncio.Semaphore = None):
+        if limiter is None:
+            return await asyncio.to_thread(fn, *args)
+        # Only the leader takes a slot; coalesced callers just await its result.
+        async with limiter:
+            return await asyncio.to_thread(fn, *args)
+
+
+class GenerateRequest(BaseModel):
+    user_prompt: str
+    model: str | None = None
+    context: str | None = None
+
+
+class ExecuteRequest(BaseModel):
+    sql_query: str
+
+
+state = {}
+flights = SingleFlight()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm, process-wide resources shared by every request.
+    state["pool"] = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_PARAMS)
+    # getconn raises PoolError instead of waiting when the pool is exhausted, and
+    # the to_thread executor has more threads than the pool has connections.
+    state["db_slots"] = asyncio.Semaphore(DB_POOL_MAX)
+    state["example_store"] = None
+    if EXAMPLE_STORE_DIR:
+        from example_store import ExampleStore
+
+        state["example_store"] = ExampleStore(EXAMPLE_STORE_DIR)
+    try:
+        with open(CONTEXT_FILE, "r") as f:
+            state["context"] = f.read()
+    except FileNotFoundError:
+        state["context"] = ""
+    yield
+    state["pool"].closeall()
+
+
+app = FastAPI(title="Cricket Text-to-SQL", lifespan=lifespan)
+
+
+def new_handler(model: str = None) -> LLMQueryHandler:
+    """Handlers keep per-conversation messages, so each request gets its own over shared resources."""
+    return LLMQueryHandler(
+        model=model or GPT_MODEL,
+        vector_store=VECTOR_STORE,
+        embed_model=EMBED_MODEL,
+        db_params=DB_PARAMS,
+        top_k=3,
+        example_store=state["example_store"],
+        connection_pool=state["pool"],
+        priority=INTERACTIVE,
+    )
+
+
+def get_schemas(user_prompt: str) -> list[str]:
+    return new_handler().get_semantic_schemas(user_prompt)
+
+
+def generate(user_prompt: str, model: str, context: str, schemas: list[str]) -> dict:
+    handler = new_handler(model)
+    handler.generate_initial_query(schemas, user_prompt, context=context)
+    output = handler.generate_validated_sql_query()
+    log_generated_query(user_prompt, output["SQL_QUERY"], model=output["MODEL"], source="service")
+    return output
+
+
+def execute(sql_query: str) -> dict:
+    # /execute accepts arbitrary text, so enforce the same read-only checks as generated SQL.
+    sql_query, errors = validate_sql(sql_query)
+    if errors:
+        return {"error": "; ".join(errors)}
+    df, error = new_handler().execute_sql_on_db(sql_query, guard=True)
+    if error is not None:
+        return {"error": error}
+    return {"error": None, "data": json.loads(df.to_json(orient="split", index=False, date_format="iso"))}
+
+
+async def generate_coalesced(request: GenerateRequest) -> dict:
+    model = request.model or GPT_MODEL
+    context = request.context if request.context is not None else state["context"]
+    schemas = await flights.do(("schemas", request.user_prompt), get_schemas, request.user_prompt)
+    key = ("sql", model, context, request.user_prompt)
+    return await flights.do(key, generate, request.user_prompt, model, context, schemas)
+
+
+async def execute_coalesced(sql_query: str) -> dict:
+    return await flights.do(("execute", sql_query), execute, sql_query, limiter=state["db_slots"])
+
+
+@app.post("/generate")
+async def generate_endpoint(request: GenerateRequest):
+    try:
+        output = await generate_coalesced(request)
+    except Exception as e:
+        logger.exception(f"Error in SQL Query Generation: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+    return output
+
+
+@app.post("/execute")
+async def execute_endpoint(request: ExecuteRequest):
+    result = await execute_coalesced(request.sql_query)
+    if result["error"] is not None:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result["data"]
+
+
+@app.post("/query")
+async def query_endpoint(request: GenerateRequest):
+    try:
+        output = await generate_coalesced(request)
+    except Exception as e:
+        logger.exception(f"Error in SQL Query Generation: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+    result = await execute_coalesced(output["SQL_QUERY"])
+    if result["error"] is not None:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return {"sql_query": output["SQL_QUERY"], "model": output["MODEL"], "data": result["data"]}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.environ.get("SERVICE_HOST", "0.0.0.0"), port=int(os.environ.get("SERVICE_PORT", 8000)))
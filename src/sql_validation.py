@@ -0,0 +1,143 @@
+import re
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+# Statement types that must never reach the database from generated SQL.
+WRITE_EXPRESSIONS = (
+    exp.Insert,
+    exp.Update,
+    exp.Delete,
+    exp.Merge,
+    exp.Create,
+    exp.Drop,
+    exp.AlterTable,
+    exp.TruncateTable,
+    exp.Command,
+    exp.Into,  # SELECT ... INTO creates a table
+)
+
+
+def strip_sql_fences(text: str) -> str:
+    """Remove markdown code fences and surrounding chatter from an LLM response."""
+    text = text.strip()
+    fenced = re.search(r"```(?:sql|postgresql)?\s*(.*?)```", text, re.IGNORECASE | re.DOTALL)
+    if fenced:
+        text = fenced.group(1).strip()
+    return text.rstrip(";").strip()
+
+
+def parse_schema_columns(schemas: list[str]) -> dict[str, set[str]]:
+    """
+    Extract table -> column names from CREATE TABLE statements.
+    Accepts the raw schema texts returned by the vector store, which may carry
+    a description before the DDL.
+    """
+    tables = {}
+    for schema in schemas:
+        for statement in re.findall(r"CREATE TABLE.*?\)\s*(?:;|$)", schema, re.IGNORECASE | re.DOTALL):
+            try:
+                create = sqlglot.parse_one(statement, read="postgres")
+            except ParseError:
+                continue
+            if not isinstance(create, exp.Create) or not isinstance(create.this, exp.Schema):
+                continue
+            table_name = create.this.this.name.lower()
+            columns = {
+                column.name.lower()
+                for column in create.this.expressions
+                if isinstance(column, exp.ColumnDef)
+            }
+            tables[table_name] = columns
+    return tables
+
+
+def validate_sql(sql: str, schema_columns: dict[str, set[str]] = None, conn=None) -> tuple[str, list[str]]:
+    """
+    Validate generated SQL without executing it.
+
+    Parameters:
+    ----
+    - sql (str): Raw LLM output, optionally wrapped in markdown fences.
+    - schema_columns (dict, optional): table -> columns, see `parse_schema_columns`.
+      Table/column checks are skipped when not given.
+    - conn (optional): psycopg2 connection. When given the query is also run
+      through EXPLAIN so the planner can reject it.
+
+    Returns:
+    ----
+    - (cleaned_sql, errors): errors is empty when the query is safe to execute.
+    """
+    cleaned_sql = strip_sql_fences(sql)
+    try:
+        statements = [s for s in sqlglot.parse(cleaned_sql, read="postgres") if s is not None]
+    except ParseError as e:
+        return cleaned_sql, [f"Syntax error: {e}"]
+
+    if len(statements) != 1:
+        return cleaned_sql, [f"Expected exactly one statement, found {len(statements)}."]
+    tree = statements[0]
+
+    errors = []
+    if not isinstance(tree, exp.Query) or any(tree.find_all(*WRITE_EXPRESSIONS)):
+        errors.append("Only read-only SELECT queries are allowed.")
+
+    if schema_columns:
+        errors.extend(_check_references(tree, schema_columns))
+
+    if conn is not None and not errors:
+        errors.extend(explain_sql(conn, cleaned_sql))
+
+    return cleaned_sql, errors
+
+
+def explain_sql(conn, sql: str) -> list[str]:
+    """Ask PostgreSQL to plan the query; planning errors are returned, nothing is executed."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"EXPLAIN {sql}")
+        return []
+    except Exception as e:
+        return [f"Database rejected the query: {str(e).strip()}"]
+    finally:
+        conn.rollback()
+
+
+def _check_references(tree: exp.Expression, schema_columns: dict[str, set[str]]) -> list[str]:
+    errors = []
+    cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    subquery_aliases = {
+        subquery.alias_or_name.lower() for subquery in tree.find_all(exp.Subquery) if subquery.alias
+    }
+
+    # alias -> table name for every real table referenced
+    aliases = {}
+    for table in tree.find_all(exp.Table):
+        name = table.name.lower()
+        if name in cte_names:
+            continue
+        if name not in schema_columns:
+            errors.append(f"Unknown table '{table.name}'.")
+            continue
+        aliases[table.alias_or_name.lower()] = name
+
+    projection_aliases = {
+        alias.alias.lower() for alias in tree.find_all(exp.Alias) if alias.alias
+    }
+    known_columns = set().union(*(schema_columns[name] for name in aliases.values())) if aliases else set()
+    # Unqualified columns can only be checked when every source is a known table.
+    check_unqualified = not cte_names and not subquery_aliases and not errors
+
+    for column in tree.find_all(exp.Column):
+        column_name = column.name.lower()
+        if not column_name or isinstance(column.this, exp.Star):
+            continue
+        qualifier = column.table.lower()
+        if qualifier:
+            if qualifier in aliases and column_name not in schema_columns[aliases[qualifier]]:
+                errors.append(f"Unknown column '{column.table}.{column.name}'.")
+        elif check_unqualified and column_name not in known_columns | projection_aliases:
+            errors.append(f"Unknown column '{column.name}'.")
+
+    # keep the first occurrence of each message, in order
+    return list(dict.fromkeys(errors))
@@ -1,10 +1,12 @@
 import streamlit as st
 import psycopg2
-import pandas as pd
 import os
 import re
 import json
+import math
 from dotenv import load_dotenv
+from cost_guard import guard_query
+from pagination import FILTER_OPERATORS, count_rows, fetch_page, get_columns
 
 load_dotenv()
 
@@ -13,23 +15,60 @@ EMBED_MODEL = os.environ.get("EMBED_MODEL")    # text-embedding-3-small
 GPT_MODEL = os.environ.get("GPT_MODEL")        # gpt-4o-mini
 METRIC_FILENAME = os.environ.get("METRIC_FILENAME")
 CONTEXT_PROMPT_FILE_PATH = os.environ.get("CONTEXT_PROMPT_FILE_PATH")
+PAGE_SIZES = [50, 100, 500, 1000]
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 600))
 
 
 # ---------- DATABASE HELPERS ----------
+def connect_readonly(conn_params: dict):
+    conn = psycopg2.connect(**conn_params)
+    conn.set_session(readonly=True)
+    return conn
+
+
+# Results are never materialised in full: the row count and each page are
+# separate SQL queries, cached so reruns and page flips are cheap.
+@st.cache_data(ttl=RESULT_CACHE_TTL, show_spinner=False)
+def guard_result_query(conn_params: dict, sql_query: str) -> dict:
+    """
+    Plan-based cost check (see `cost_guard.guard_query`) before any page query runs.
+    Only the cost budget applies: pages already bound the rows transferred, and a
+    row LIMIT would make counting, sorting and filtering see an arbitrary slice.
+    """
+    conn = connect_readonly(conn_params)
+    try:
+        return guard_query(conn, sql_query, max_rows=float("inf"))
+    finally:
+        conn.close()
+
+
+@st.cache_data(ttl=RESULT_CACHE_TTL, show_spinner=False)
 def get_column_names_from_db(conn_params: dict, sql_query: str) -> list[str]:
-    """Retrieve column names from a PostgreSQL query result."""
-    cols = []
-    with psycopg2.connect(**conn_params) as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql_query)
-            cols = [desc[0] for desc in cur.description]
-    return cols
+    """Retrieve column names of a PostgreSQL query result without running it."""
+    conn = connect_readonly(conn_params)
+    try:
+        return get_columns(conn, sql_query)
+    finally:
+        conn.close()
 
 
-def execute_sql_on_db(conn_params: dict, query: str, params=None) -> pd.DataFrame:
-    """Executes SQL query on PostgreSQL and returns result as pandas DataFrame."""
-    with psycopg2.connect(**conn_params) as conn:
-        return pd.read_sql_query(query, conn, params=params)
+@st.cache_data(ttl=RESULT_CACHE_TTL, show_spinner=False)
+def count_result_rows(conn_params: dict, sql_query: str, filters: tuple) -> int:
+    conn = connect_readonly(conn_params)
+    try:
+        return count_rows(conn, sql_query, filters)
+    finally:
+        conn.close()
+
+
+@st.cache_data(ttl=RESULT_CACHE_TTL, show_spinner=False)
+def fetch_result_page(conn_params: dict, sql_query: str, page_size: int, offset: int, sort_column, descending: bool, filters: tuple, keyset):
+    """One page as an Arrow table, plus the keyset for the following page."""
+    conn = connect_readonly(conn_params)
+    try:
+        return fetch_page(conn, sql_query, page_size, offset, sort_column, descending, filters, keyset)
+    finally:
+        conn.close()
 
 
 # ---------- STREAMLIT HELPERS ----------
@@ -47,8 +86,46 @@ def display_schemas(schemas):
         st.code(sql_statement, language="sql")
 
 
+def display_paginated_results(conn_params: dict, sql_query: str):
+    """Render a query result page by page; sorting and filtering are pushed into SQL."""
+    columns = get_column_names_from_db(conn_params, sql_query)
+
+    col1, col2, col3 = st.columns(3)
+    page_size = col1.selectbox("Rows per page", PAGE_SIZES, index=1)
+    sort_choice = col2.selectbox("Sort by", ["(none)"] + columns)
+    descending = col3.checkbox("Descending")
+    with st.expander("Filter"):
+        filter_column = st.selectbox("Column", ["(none)"] + columns, key="filter_column")
+        filter_operator = st.selectbox("Operator", ["contains"] + list(FILTER_OPERATORS), key="filter_operator")
+        filter_value = st.text_input("Value", key="filter_value")
+
+    sort_column = None if sort_choice == "(none)" else sort_choice
+    filters = ((filter_column, filter_operator, filter_value),) if filter_column != "(none)" and filter_value else ()
+
+    # Keysets are only valid for the view they were computed in.
+    view = (sql_query, page_size, sort_column, descending, filters)
+    if st.session_state.get("result_view") != view:
+        st.session_state["result_view"] = view
+        st.session_state["result_keysets"] = {}
+        st.session_state["result_page"] = 1
+
+    total_rows = count_result_rows(conn_params, sql_query, filters)
+    n_pages = max(1, math.ceil(total_rows / page_size))
+    page = st.number_input("Page", min_value=1, max_value=n_pages, step=1, key="result_page")
+
+    keysets = st.session_state["result_keysets"]
+    table, next_keyset = fetch_result_page(
+        conn_params, sql_query, page_size, (page - 1) * page_size,
+        sort_column, descending, filters, keysets.get(page - 1),
+    )
+    keysets[page] = next_keyset
+
+    st.caption(f"{total_rows} rows, page {page} of {n_pages}")
+    st.dataframe(table, use_container_width=True)
+
+
 def reset_app():
-    keys_to_reset = ["user_has_interacted", "context_prompt", "user_prompt"]
+    keys_to_reset = ["user_has_interacted", "context_prompt", "user_prompt", "generation_key"]
     for key in keys_to_reset:
         st.session_state[key] = "" if key == "user_prompt" else None
 
@@ -106,6 +183,11 @@ db_user = st.sidebar.text_input("User", value="postgres")
 db_password = st.sidebar.text_input("Password", type="password")
 db_name = st.sidebar.text_input("Database", value="cricketdb")
 
+approximate = st.sidebar.checkbox(
+    "Approximate first look",
+    help="Show an estimate from a table sample while the exact answer is computed",
+)
+
 conn_params = {
     "host": db_host,
     "port": db_port,
@@ -139,42 +221,142 @@ if view_context:
 if user_prompt and user_has_interacted:
     with st.spinner("Processing..."):
         try:
-            from src.query_llm import LLMQueryHandler
-
-            handler = LLMQueryHandler(
-                model=GPT_MODEL,
-                vector_store=VECTOR_STORE,   # Pinecone
-                embed_model=EMBED_MODEL,
-                top_k=3,
-            )
-
-            # get schemas semantically similar to user query
-            schemas = handler.get_semantic_schemas(user_prompt)
-            display_schemas(schemas)
-
-            # generate SQL query
-            output = handler.generate_sql_query(
-                schemas,
-                user_prompt,
-                context=context_prompt,
-            )
-            sql_query = output["SQL_QUERY"]
+            from query_llm import LLMQueryHandler
+            from rate_limiter import INTERACTIVE
+            from utils import log_generated_query
+
+            # Widgets rerun the script; only call the LLM when the prompt changes.
+            generation_key = (user_prompt, context_prompt)
+            if st.session_state.get("generation_key") != generation_key:
+                handler = LLMQueryHandler(
+                    model=GPT_MODEL,
+                    vector_store=VECTOR_STORE,   # Pinecone
+                    embed_model=EMBED_MODEL,
+                    db_params=conn_params,
+                    top_k=3,
+                    priority=INTERACTIVE,        # served ahead of batch CLI work
+                )
+
+                # get schemas semantically similar to user query
+                schemas = handler.get_semantic_schemas(user_prompt)
+
+                # generate SQL query
+                handler.generate_initial_query(schemas, user_prompt, context=context_prompt)
+                output = handler.generate_validated_sql_query()
+                log_generated_query(user_prompt, output["SQL_QUERY"], model=output["MODEL"], source="streamlit")
+
+                # cost calc
+                cost = handler.calculate_query_execution_cost(
+                    output["MODEL"], output["N_PROMPT_TOKENS"], output["N_GENERATED_TOKENS"]
+                )
+                update_query_cost(cost)
+                st.session_state["generation_key"] = generation_key
+                st.session_state["generation"] = {"schemas": schemas, "output": output, "cost": cost}
+
+            generation = st.session_state["generation"]
+            display_schemas(generation["schemas"])
+            sql_query = generation["output"]["SQL_QUERY"]
             st.write("SQL Query:")
             st.code(sql_query, language="sql")
 
-            # cost calc
-            cost = handler.calculate_query_execution_cost(
-                GPT_MODEL, output["N_PROMPT_TOKENS"], output["N_GENERATED_TOKENS"]
-            )
-            update_query_cost(cost)
             data = read_metric_file()
             total_cost = data["total_cost"]
-            st.write(f"Query Cost: ${cost}")
+            st.write(f"Query Cost: ${generation['cost']}")
             st.write(f"Total Cost: ${total_cost}")
 
-            # execute query on PostgreSQL instead of SQLite
-            df = execute_sql_on_db(conn_params, sql_query)
-            st.dataframe(df)
+            exact_result, exact_error = None, None
+            run = None
+            if approximate:
+                # Sampled estimate first for aggregate queries; the exact query already runs
+                # in the background and is kept in session_state so reruns do not start it again.
+                from approximate import can_approximate, run_progressive, relative_error
+
+                run_key = (sql_query, tuple(conn_params.items()))
+                if st.session_state.get("progressive_key") != run_key:
+                    guard_actions = {}
+
+                    def execute_guarded(sql):
+                        # One handler per call: sampled and exact queries run concurrently
+                        # and each needs its own `last_guard`.
+                        executor = LLMQueryHandler(GPT_MODEL, VECTOR_STORE, EMBED_MODEL, conn_params, priority=INTERACTIVE)
+                        df, error = executor.execute_sql_on_db(sql, guard=True)
+                        if executor.last_guard is not None:
+                            guard_actions[sql] = executor.last_guard["ACTION"]
+                        return df, error
+
+                    st.session_state["progressive_run"] = (
+                        run_progressive(execute_guarded, sql_query) if can_approximate(sql_query) else None
+                    )
+                    st.session_state["progressive_guard_actions"] = guard_actions
+                    st.session_state["progressive_key"] = run_key
+                run = st.session_state["progressive_run"]
+
+            if run is not None and run["ESTIMATE"] is not None:
+                early = st.empty()
+                if not run["EXACT"].done():
+                    error_bound = relative_error(run["ESTIMATE"])
+                    bound_text = "" if math.isnan(error_bound) else f", within ±{error_bound:.0%} (95%)"
+                    with early.container():
+                        st.caption(
+                            f"Early estimate from a {run['SAMPLE_PERCENT']:g}% sample{bound_text}. "
+                            "Refining to the exact answer..."
+                        )
+                        st.dataframe(run["ESTIMATE"], use_container_width=True)
+                with st.spinner("Computing exact answer..."):
+                    exact_result, exact_error = run["EXACT"].result()
+                early.empty()
+                if exact_error:
+                    st.error(exact_error)
+
+            if exact_error is None:
+                # the exact answer, one page at a time after the cost guard
+                guard = guard_result_query(conn_params, sql_query)
+                if guard["ACTION"] == "rejected":
+                    st.error(f"Query rejected by cost guard: {guard['REASON']}")
+                else:
+                    if guard["ACTION"] == "rewritten":
+                        st.info("The query was rewritten to stay within the cost budget.")
+                        st.code(guard["SQL_QUERY"], language="sql")
+                    display_paginated_results(conn_params, guard["SQL_QUERY"])
+
+            # Follow-ups refine the answer; small results are cached in memory so
+            # narrowing/sorting them does not go back to PostgreSQL. The first
+            # result is only loaded when a follow-up needs it.
+            from conversation import Conversation
+
+            if st.session_state.get("conversation_key") != generation_key:
+                conversation = Conversation(
+                    LLMQueryHandler(
+                        model=GPT_MODEL,
+                        vector_store=VECTOR_STORE,
+                        embed_model=EMBED_MODEL,
+                        db_params=conn_params,
+                        top_k=3,
+                        priority=INTERACTIVE,
+                    ),
+                    context_prompt,
+                )
+                if exact_result is not None:
+                    # A result truncated by the guard's LIMIT cannot answer follow-ups.
+                    complete = st.session_state["progressive_guard_actions"].get(sql_query) == "ok"
+                    conversation.record_turn(user_prompt, sql_query, exact_result if complete else None)
+                else:
+                    conversation.record_turn(user_prompt, sql_query, lazy=True)
+                st.session_state["conversation"] = conversation
+                st.session_state["conversation_key"] = generation_key
+                st.session_state["follow_ups"] = []
+
+            follow_up = st.text_input("Follow-up question:", key="follow_up")
+            if st.button("Ask") and follow_up:
+                answer = st.session_state["conversation"].ask(follow_up)
+                st.session_state["follow_ups"].append((follow_up, answer))
+            for question, answer in st.session_state["follow_ups"]:
+                st.markdown(f"**{question}** ({'from cached result' if answer['SOURCE'] == 'cache' else 'from database'})")
+                st.code(answer["SQL_QUERY"], language="sql")
+                if answer["ERROR"]:
+                    st.error(answer["ERROR"])
+                else:
+                    st.dataframe(answer["DATAFRAME"], use_container_width=True)
 
             if st.button("Reset"):
                 reset_app()
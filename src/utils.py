@@ -3,16 +3,40 @@ import os
 import sys
 import hashlib
 import re
+import json
+import copy
+import queue
+import atexit
+import threading
 from datetime import datetime
 import logging
+from logging.handlers import QueueHandler, QueueListener
 
 load_dotenv()
 
 
+# Name of the running program, attached to every structured log record.
+PROGRAM_NAME = os.path.splitext(os.path.basename(sys.argv[0] if sys.argv and sys.argv[0] else "unknown_program"))[0]
+
+
 class DynamicPathFileHandler(logging.FileHandler):
-    def __init__(self, directory, filename, mode="a", encoding=None, delay=False):
+    """
+    File handler writing to LOG_DIR/<year>/<month>/<ddmmyyyy><filename>.
+
+    The path is re-checked on every record so long-running processes roll over
+    at midnight, and a file larger than `max_bytes` continues in a numbered
+    part (<ddmmyyyy>.1<filename>, ...). Writes are flushed every `batch_size`
+    records or when `flush()` is called by the queue listener when idle.
+    """
+
+    def __init__(self, directory, filename, mode="a", encoding=None, delay=False, max_bytes=0, batch_size=100):
         self.base_directory = directory
         self.base_filename = filename
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.pending = 0
+        self.part = 0
+        self.current_date = datetime.now().date()
         filepath = self._calculate_dynamic_path()
         super().__init__(filepath, mode, encoding, delay)
 
@@ -23,34 +47,195 @@ class DynamicPathFileHandler(logging.FileHandler):
         )
         os.makedirs(directory, exist_ok=True)
 
+        part = f".{self.part}" if self.part else ""
         filepath = os.path.join(
-            directory, date_now.strftime("%d%m%Y") + self.base_filename
+            directory, date_now.strftime("%d%m%Y") + part + self.base_filename
         )
         self.currently_logging_to = filepath
         return filepath
 
+    def _should_rollover(self):
+        if datetime.now().date() != self.current_date:
+            self.current_date = datetime.now().date()
+            self.part = 0
+            return True
+        if self.max_bytes and self.stream is not None and self.stream.tell() >= self.max_bytes:
+            self.part += 1
+            return True
+        return False
+
+    def _rollover(self):
+        if self.stream is not None:
+            self.stream.flush()
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = os.path.abspath(self._calculate_dynamic_path())
+        # A part left over from an earlier run may already be full.
+        while self.max_bytes and os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) >= self.max_bytes:
+            self.part += 1
+            self.baseFilename = os.path.abspath(self._calculate_dynamic_path())
+        self.pending = 0
+
     def emit(self, record):
-        module_name = os.path.basename(sys.argv[0] if sys.argv[0] else "unknown_program")
-        record_program = os.path.splitext(module_name)[0]
-        super().emit(record)
+        try:
+            if self._should_rollover():
+                self._rollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        super().flush()
+        self.pending = 0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        data = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "program": PROGRAM_NAME,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class _PreparingQueueHandler(QueueHandler):
+    """Render message and traceback on the caller's thread; everything else happens on the listener."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _BatchingQueueListener(QueueListener):
+    """Queue listener that flushes its handlers whenever the queue goes idle."""
+
+    def __init__(self, log_queue, *handlers, flush_interval=1.0):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block=block, timeout=self.flush_interval if block else None)
+            except queue.Empty:
+                if not block:
+                    raise
+                for handler in self.handlers:
+                    handler.flush()
+
+
+_log_queue = None
+_log_listener = None
+
+
+def _get_log_queue():
+    """Start the process-wide log listener on first use."""
+    global _log_queue, _log_listener
+    if _log_queue is None:
+        LOG_DIR = os.environ.get("LOG_DIR", "./logs")  # default to ./logs
+        file_handler = DynamicPathFileHandler(
+            directory=LOG_DIR,
+            filename=".log",
+            max_bytes=int(os.environ.get("LOG_MAX_BYTES", 50 * 1024 * 1024)),
+            batch_size=int(os.environ.get("LOG_BATCH_SIZE", 100)),
+        )
+        if os.environ.get("LOG_FORMAT", "json") == "json":
+            file_handler.setFormatter(JsonFormatter())
+        else:
+            file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(os.environ.get("LOG_CONSOLE_LEVEL", "WARNING"))
+        console_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+        _log_queue = queue.SimpleQueue()
+        _log_listener = _BatchingQueueListener(
+            _log_queue,
+            file_handler,
+            console_handler,
+            flush_interval=float(os.environ.get("LOG_FLUSH_INTERVAL", 1.0)),
+        )
+        _log_listener.start()
+        # Drain and flush whatever is still queued when the process exits.
+        atexit.register(_log_listener.stop)
+    return _log_queue
 
 
 def setup_logger(name=__name__):
-    """Setup structured logger with dynamic file path."""
-    LOG_DIR = os.environ.get("LOG_DIR", "./logs")  # default to ./logs
+    """
+    Setup structured logger. Records are handed to a background thread through
+    a queue, so logging never blocks on file I/O; see `DynamicPathFileHandler`.
+    """
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
 
-    handler = DynamicPathFileHandler(directory=LOG_DIR, filename=".log")
-    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    handler.setFormatter(formatter)
-
     if not logger.handlers:
-        logger.addHandler(handler)
+        logger.addHandler(_PreparingQueueHandler(_get_log_queue()))
 
     return logger
 
 
+_query_logger = None
+_query_logger_lock = threading.Lock()
+
+
+def _get_query_logger():
+    """Logger for the JSONL query log, written by its own queue listener like the application log."""
+    global _query_logger
+    with _query_logger_lock:
+        if _query_logger is None:
+            query_log_path = os.environ.get(
+                "QUERY_LOG_PATH", os.path.join(os.environ.get("LOG_DIR", "./logs"), "generated_queries.jsonl")
+            )
+            os.makedirs(os.path.dirname(query_log_path) or ".", exist_ok=True)
+            file_handler = logging.FileHandler(query_log_path, delay=True)
+            file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+            log_queue = queue.SimpleQueue()
+            listener = _BatchingQueueListener(
+                log_queue, file_handler, flush_interval=float(os.environ.get("LOG_FLUSH_INTERVAL", 1.0))
+            )
+            listener.start()
+            atexit.register(listener.stop)
+
+            logger = logging.getLogger("generated_queries")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(_PreparingQueueHandler(log_queue))
+            _query_logger = logger
+    return _query_logger
+
+
+def log_generated_query(user_prompt: str, sql_query: str, model: str = None, source: str = None):
+    """Queue a generated query for the JSONL query log used by the index advisor; the file is written in the background."""
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "source": source or os.path.splitext(os.path.basename(sys.argv[0] or "unknown_program"))[0],
+        "model": model,
+        "user_prompt": user_prompt,
+        "sql_query": sql_query,
+    }
+    _get_query_logger().info(json.dumps(record))
+
+
 def sanitize_filename(input_str):
     """Replace invalid filename characters with underscores."""
     return re.sub(r"[^a-zA-Z0-9_]", "_", input_str)
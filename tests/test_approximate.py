@@ -0,0 +1,70 @@
+import os
+import sys
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from approximate import rewrite_for_sample, run_progressive  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def con():
+    # 50 batsmen with very different totals, shuffled so every sampled page sees most of them.
+    rng = np.random.default_rng(0)
+    batsman = rng.choice(50, size=300_000, p=np.arange(1, 51) / np.arange(1, 51).sum())
+    deliveries = pd.DataFrame({"batsman": [f"b{i:02d}" for i in batsman], "runs": rng.integers(0, 7, batsman.size)})
+    con = duckdb.connect(database=":memory:")
+    con.register("source", deliveries)
+    con.execute("CREATE TABLE deliveries AS SELECT * FROM source")
+    return con
+
+
+def _execute(con):
+    def execute(sql):
+        cursor = con.cursor()
+        try:
+            return cursor.execute(sql).df(), None
+        finally:
+            cursor.close()
+
+    return execute
+
+
+@pytest.mark.parametrize(
+    "sql_query",
+    [
+        "SELECT batsman, SUM(runs) AS total FROM deliveries GROUP BY batsman LIMIT 5",
+        "SELECT batsman, SUM(runs) AS total FROM deliveries GROUP BY batsman HAVING SUM(runs) > 10",
+    ],
+)
+def test_limit_and_having_are_not_sampled(sql_query):
+    with pytest.raises(ValueError):
+        rewrite_for_sample(sql_query, 10, 42, dialect="duckdb")
+
+
+def test_top_n_is_applied_to_the_merged_estimate(con):
+    sql_query = "SELECT batsman, SUM(runs) AS total FROM deliveries GROUP BY batsman ORDER BY total DESC LIMIT 5"
+    run = run_progressive(_execute(con), sql_query, dialect="duckdb", sample_percent=40, replicates=4)
+    exact, error = run["EXACT"].result()
+    assert error is None
+    assert len(exact) == 5
+
+    estimate = run["ESTIMATE"]
+    assert estimate is not None, run["REASON"]
+    assert len(estimate) == 5
+    assert estimate["total"].is_monotonic_decreasing
+    exact_totals = dict(con.execute("SELECT batsman, SUM(runs) FROM deliveries GROUP BY batsman").fetchall())
+    for batsman, total in zip(estimate["batsman"], estimate["total"]):
+        assert abs(total - exact_totals[batsman]) < 0.2 * exact_totals[batsman]
+
+
+def test_having_waits_for_the_exact_answer(con):
+    sql_query = "SELECT batsman, SUM(runs) AS total FROM deliveries GROUP BY batsman HAVING SUM(runs) > 10"
+    run = run_progressive(_execute(con), sql_query, dialect="duckdb")
+    assert run["ESTIMATE"] is None
+    assert "HAVING" in run["REASON"]
+    assert run["EXACT"].result()[1] is None
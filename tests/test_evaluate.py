@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from evaluate import results_match  # noqa: E402
+
+
+def test_columns_with_the_same_values_pair_either_way():
+    gold = pd.DataFrame({"team1": ["A", "B"], "team2": ["B", "A"], "runs": [10, 20]})
+    predicted = gold[["team2", "team1", "runs"]].rename(columns={"team2": "x", "team1": "y"})
+    assert results_match(gold, predicted)
+
+
+def test_row_order_and_names_are_ignored():
+    gold = pd.DataFrame({"batsman": ["A", "B", "B"], "runs": [10, 20, 20]})
+    predicted = pd.DataFrame({"total": [20, 10, 20], "name": ["B", "A", "B"]})
+    assert results_match(gold, predicted)
+
+
+def test_rows_must_match_not_only_columns():
+    gold = pd.DataFrame({"team1": ["A", "B", "C"], "team2": ["B", "C", "A"], "runs": [10, 20, 30]})
+    predicted = pd.DataFrame({"team1": ["A", "B", "C"], "team2": ["B", "C", "A"], "runs": [20, 10, 30]})
+    assert not results_match(gold, predicted)
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from sql_validation import validate_sql  # noqa: E402  fails if the pinned sqlglot lacks an expression we use
+
+
+def test_select_is_accepted():
+    sql_query, errors = validate_sql("```sql\nSELECT season, COUNT(*) FROM deliveries GROUP BY season;\n```")
+    assert errors == []
+    assert sql_query == "SELECT season, COUNT(*) FROM deliveries GROUP BY season"
+
+
+def test_writes_are_rejected():
+    for statement in [
+        "INSERT INTO deliveries VALUES (1)",
+        "UPDATE deliveries SET runs = 0",
+        "DELETE FROM deliveries",
+        "DROP TABLE deliveries",
+        "ALTER TABLE deliveries ADD COLUMN x int",
+        "SELECT * INTO evil FROM deliveries",
+    ]:
+        assert validate_sql(statement)[1], statement
+
+
+def test_unknown_columns_are_reported():
+    _, errors = validate_sql("SELECT wickets FROM deliveries", {"deliveries": {"runs", "season"}})
+    assert errors == ["Unknown column 'wickets'."]